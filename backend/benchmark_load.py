@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the MemeArena backend.
+Boots the app in-process against a local mongod (or an in-process mongomock-motor fake),
+seeds users, memes and votes, then drives a weighted mix of feed reads, image GETs,
+votes, uploads and logins at a fixed concurrency. Reports throughput and p50/p95/p99
+latency per route and can save the results as JSON for comparing two runs.
+
+Usage: python benchmark_load.py [--uri mongodb://localhost:27017 | --mongomock]
+       [--users 50] [--memes 200] [--votes 1000] [--concurrency 16] [--duration 30]
+       [--mix feed=50,image=25,vote=15,upload=5,login=5] [--output results.json]
+       [--compare baseline.json]
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+PASSWORD = "benchmark-password"
+
+def parse_mix(value: str) -> dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = int(weight)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown operations: {', '.join(sorted(unknown))}")
+    return mix
+
+def write_config(args: argparse.Namespace, directory: str) -> None:
+    """
+    Writes the config.toml main.py loads on import.
+    """
+    with open(os.path.join(directory, "config.toml"), "w", encoding="utf-8") as f:
+        f.write(
+            f'[mongodb]\nuri = "{args.uri}"\ndb = "{args.db}"\n'
+            f'[auth]\nsession_ttl = 3600\nadmin_username = "admin"\nbcrypt_rounds = {args.bcrypt_rounds}\n'
+            f'[storage]\npath = "{os.path.join(directory, "blobs")}"\n'
+            f'[upload]\nmode = "{args.upload_mode}"\n'
+            # Every simulated client shares one address, so limits would mostly measure 429s.
+            f'[rate_limit]\nenabled = {"true" if args.rate_limit else "false"}\n'
+        )
+
+def make_jpeg(seed: int) -> bytes:
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), (seed * 37 % 256, seed * 91 % 256, seed * 53 % 256)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+def percentile(ordered: list[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+    def record(self, route: str, seconds: float, ok: bool) -> None:
+        self.latencies.setdefault(route, []).append(seconds)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+    def summary(self, elapsed: float) -> dict:
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            routes[route] = {
+                "requests": len(ordered),
+                "errors": self.errors.get(route, 0),
+                "throughput": len(ordered) / elapsed,
+                "p50_ms": percentile(ordered, 0.50) * 1000,
+                "p95_ms": percentile(ordered, 0.95) * 1000,
+                "p99_ms": percentile(ordered, 0.99) * 1000
+            }
+        total = sum(route["requests"] for route in routes.values())
+        return {
+            "elapsed": elapsed,
+            "requests": total,
+            "errors": sum(route["errors"] for route in routes.values()),
+            "throughput": total / elapsed,
+            "routes": routes
+        }
+
+class Workload:
+    def __init__(self, client, seed: dict, recorder: Recorder) -> None:
+        self.client = client
+        self.seed = seed
+        self.recorder = recorder
+    def headers(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {random.choice(self.seed['tokens'])}"}
+    async def timed(self, route: str, request) -> None:
+        start = time.perf_counter()
+        try:
+            response = await request
+            ok = response.status_code in (200, 206, 304) and (
+                not response.headers.get("content-type", "").startswith("application/json")
+                or response.json()["success"]
+            )
+        except Exception:
+            ok = False
+        self.recorder.record(route, time.perf_counter() - start, ok)
+    async def feed(self) -> None:
+        params = {"sort": random.choice(["new", "top", "hot"]), "limit": 8}
+        await self.timed("GET /a/meme", self.client.get("/a/meme", params=params, headers=self.headers()))
+    async def image(self) -> None:
+        meme_id = random.choice(self.seed["meme_ids"])
+        size = random.choice(["thumb", "feed", "full"])
+        await self.timed("GET /a/meme/{id}", self.client.get(f"/a/meme/{meme_id}", params={"size": size}))
+    async def vote(self) -> None:
+        meme_id = random.choice(self.seed["meme_ids"])
+        body = {"upvote": random.random() < 0.7, "clicked": random.random() < 0.7}
+        # A vote that changes nothing answers success=False by design, so only transport errors count.
+        start = time.perf_counter()
+        try:
+            response = await self.client.put(f"/a/meme/{meme_id}/vote", json=body, headers=self.headers())
+            ok = response.status_code == 200
+        except Exception:
+            ok = False
+        self.recorder.record("PUT /a/meme/{id}/vote", time.perf_counter() - start, ok)
+    async def upload(self) -> None:
+        files = {"image": ("bench.jpg", random.choice(self.seed["images"]), "image/jpeg")}
+        await self.timed("POST /a/meme", self.client.post(
+            "/a/meme",
+            data={"title": "benchmark upload"},
+            files=files,
+            headers=self.headers()
+        ))
+    async def login(self) -> None:
+        body = {"username": random.choice(self.seed["usernames"]), "password": PASSWORD}
+        await self.timed("POST /a/auth/login", self.client.post("/a/auth/login", json=body))
+
+OPERATIONS = {
+    "feed": Workload.feed,
+    "image": Workload.image,
+    "vote": Workload.vote,
+    "upload": Workload.upload,
+    "login": Workload.login
+}
+
+async def seed_data(main, args: argparse.Namespace) -> dict:
+    """
+    Creates users, memes and votes directly through the managers.
+    """
+    usernames = [f"bench{i}" for i in range(args.users)]
+    tokens = []
+    for username in usernames:
+        await main.authorization_manager.create_credentials(username, PASSWORD)
+        await main.profile_manager.create_profile(username, f"{username}@example.com")
+        tokens.append(await main.authorization_manager.create_auth_token(username))
+    images = [make_jpeg(i) for i in range(4)]
+    renditions = [
+        await main.image_processor.engine.transcode(image)
+        for image in images
+    ]
+    meme_ids = [
+        await main.meme_manager.add_meme(f"Benchmark meme {i}", renditions[i % len(renditions)], random.choice(usernames))
+        for i in range(args.memes)
+    ]
+    for _ in range(args.votes):
+        await main.meme_manager.vote_meme(random.choice(meme_ids), random.random() < 0.7, True, random.choice(usernames))
+    return {"usernames": usernames, "tokens": tokens, "meme_ids": meme_ids, "images": images}
+
+async def drive(workload: Workload, mix: dict[str, int], deadline: float) -> None:
+    operations = [OPERATIONS[name] for name in mix]
+    weights = list(mix.values())
+    while time.perf_counter() < deadline:
+        await random.choices(operations, weights)[0](workload)
+
+async def run(args: argparse.Namespace) -> dict:
+    import httpx
+    import core.database
+    if args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+        core.database.create_client = lambda config, **kwargs: AsyncMongoMockClient()
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        await main.meme_manager.db.client.drop_database(args.db)
+        print(f"Seeding {args.users} users, {args.memes} memes, {args.votes} votes...")
+        seed = await seed_data(main, args)
+        await main.meme_manager.leaderboard.rebuild()
+        recorder = Recorder()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+            workload = Workload(client, seed, recorder)
+            print(f"Running {args.duration}s at concurrency {args.concurrency}...")
+            start = time.perf_counter()
+            await asyncio.gather(*[
+                drive(workload, args.mix, start + args.duration)
+                for _ in range(args.concurrency)
+            ])
+            elapsed = time.perf_counter() - start
+        await main.meme_manager.db.client.drop_database(args.db)
+    return {
+        "settings": {
+            "backend": "mongomock" if args.mongomock else args.uri,
+            "users": args.users,
+            "memes": args.memes,
+            "votes": args.votes,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": args.mix,
+            "upload_mode": args.upload_mode
+        },
+        "results": recorder.summary(elapsed)
+    }
+
+def print_report(report: dict, baseline: dict | None) -> None:
+    results = report["results"]
+    base_routes = baseline["results"]["routes"] if baseline else {}
+    print(f"\n{'route':<24} {'reqs':>7} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, stats in results["routes"].items():
+        print(
+            f"{route:<24} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput']:>9.1f}"
+            f" {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}"
+        )
+        base = base_routes.get(route)
+        if base:
+            print(
+                f"{'  vs baseline':<24} {'':>7} {'':>5} {change(stats['throughput'], base['throughput']):>9}"
+                f" {change(stats['p50_ms'], base['p50_ms']):>9} {change(stats['p95_ms'], base['p95_ms']):>9}"
+                f" {change(stats['p99_ms'], base['p99_ms']):>9}"
+            )
+    print(f"\n{results['requests']} requests, {results['errors']} errors, {results['throughput']:.1f} req/s overall")
+
+def change(current: float, baseline: float) -> str:
+    if not baseline:
+        return "n/a"
+    return f"{(current - baseline) / baseline * 100:+.0f}%"
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description="MemeArena load benchmark")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="memearena_benchmark")
+    parser.add_argument("--mongomock", action="store_true", help="use mongomock-motor instead of a mongod")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--memes", type=int, default=200)
+    parser.add_argument("--votes", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--mix", type=parse_mix, default="feed=50,image=25,vote=15,upload=5,login=5")
+    parser.add_argument("--upload-mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="login cost; production uses [auth] bcrypt_rounds")
+    parser.add_argument("--rate-limit", action="store_true", help="keep [rate_limit] on; all clients share one IP")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run to compare against")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, backend_dir)
+    with tempfile.TemporaryDirectory() as directory:
+        write_config(args, directory)
+        os.chdir(directory)
+        report = asyncio.run(run(args))
+    print_report(report, baseline)
+    if args.output:
+        with open(os.path.join(backend_dir, args.output) if not os.path.isabs(args.output) else args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
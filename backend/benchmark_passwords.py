@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Password hashing benchmark.
+Measures how many logins per second the hashing pool sustains at each cost setting,
+to help size [auth] password_scheme, its cost and hash_workers.
+
+Usage: python benchmark_passwords.py [--scheme bcrypt] [--costs 10,11,12] [--workers 2] [--logins 50]
+Costs are bcrypt rounds, argon2 time cost or scrypt log2 rounds, depending on the scheme.
+"""
+
+import core.config
+import core.passwords
+import argparse
+import asyncio
+import time
+
+COST_FIELDS = {
+    "bcrypt": "bcrypt_rounds",
+    "argon2": "argon2_time_cost",
+    "scrypt": "scrypt_rounds"
+}
+
+async def measure(scheme: str, cost: int, workers: int, logins: int) -> tuple[float, float]:
+    """
+    Returns (logins per second, mean seconds per hash) for one cost setting.
+    """
+    config = core.config.Auth(
+        session_ttl=3600,
+        admin_username="admin",
+        password_scheme=scheme,
+        hash_workers=workers,
+        hash_queue_depth=logins
+    )
+    setattr(config, COST_FIELDS[scheme], cost)
+    hasher = core.passwords.PasswordHasher(config)
+    try:
+        stored_hash = await hasher.hash("correct horse battery staple")
+        start = time.perf_counter()
+        await hasher.verify("correct horse battery staple", stored_hash)
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            hasher.verify("correct horse battery staple", stored_hash)
+            for _ in range(logins)
+        ])
+        elapsed = time.perf_counter() - start
+        assert all(valid for valid, _ in results)
+        return logins / elapsed, single
+    finally:
+        hasher.shutdown()
+
+async def main(args: argparse.Namespace) -> None:
+    print(f"{'scheme':<8} {'cost':>5} {'workers':>8} {'ms/hash':>9} {'logins/s':>10}")
+    for cost in args.costs:
+        rate, single = await measure(args.scheme, cost, args.workers, args.logins)
+        print(f"{args.scheme:<8} {cost:>5} {args.workers:>8} {single * 1000:>9.1f} {rate:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Password hashing benchmark")
+    parser.add_argument("--scheme", choices=core.passwords.SCHEMES, default="bcrypt")
+    parser.add_argument("--costs", type=lambda value: [int(cost) for cost in value.split(",")], default=[10, 11, 12])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--logins", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
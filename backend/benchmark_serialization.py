@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Response serialization microbenchmark.
+Compares the model path (a MemeListResponse encoded by FastAPI's jsonable_encoder and
+JSONResponse) against the envelope fast path (schemas.common.envelope and ORJSONResponse)
+for a feed page.
+
+Usage: python benchmark_serialization.py [--memes 25] [--iterations 20000]
+"""
+
+import schemas.common
+import schemas.meme
+import argparse
+import secrets
+import time
+import timeit
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+def make_memes(count: int) -> list[dict]:
+    return [
+        {
+            "meme_id": secrets.token_urlsafe(16),
+            "title": f"Meme number {i}",
+            "username": f"user{i % 7}",
+            "votes": i * 3,
+            "created_at": time.time() - i * 60,
+            "user_vote": [True, False, None][i % 3]
+        }
+        for i in range(count)
+    ]
+
+def model_path(memes: list[dict], next_cursor: str) -> bytes:
+    response = schemas.meme.MemeListResponse(success=True, code=200, memes=memes, next_cursor=next_cursor)
+    return JSONResponse(jsonable_encoder(response)).body
+
+def envelope_path(memes: list[dict], next_cursor: str) -> bytes:
+    return ORJSONResponse(schemas.common.envelope(True, 200, memes=memes, next_cursor=next_cursor)).body
+
+def main(args: argparse.Namespace) -> None:
+    memes = make_memes(args.memes)
+    next_cursor = secrets.token_urlsafe(24)
+    assert len(model_path(memes, next_cursor)) > 0
+    results = {}
+    for name, path in (("model", model_path), ("envelope", envelope_path)):
+        seconds = min(timeit.repeat(lambda: path(memes, next_cursor), number=args.iterations, repeat=3))
+        results[name] = seconds / args.iterations * 1e6
+        print(f"{name:<10} {results[name]:>8.1f} us/response")
+    print(f"speedup    {results['model'] / results['envelope']:>8.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Response serialization microbenchmark")
+    parser.add_argument("--memes", type=int, default=25)
+    parser.add_argument("--iterations", type=int, default=20000)
+    main(parser.parse_args())
@@ -1,47 +1,250 @@
-import core.database
 import core.config
+import core.metrics
+import core.cache
+import core.passwords
+import asyncio
+import logging
 import time
 import secrets
-import hashlib
+from bson import ObjectId
+from datetime import datetime, timezone
+from jose import jwt, JWTError, ExpiredSignatureError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+def to_timestamp(value: datetime | int) -> float:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=timezone.utc).timestamp()
+    return value
 
 class AuthManager:
-    def __init__(self, config: core.config.Config) -> None:
+    def __init__(self, config: core.config.Config, db: AsyncIOMotorDatabase) -> None:
         self.config = config
-        self.db = core.database.factory(
-            config.mongodb.uri,
-            config.mongodb.db
-        )
-    def create_credentials(self, username: str, password: str) -> bool:
-        if self.db["user_credentials"].find_one({"username": username}):
+        self.db = db
+        self.password_hasher = core.passwords.PasswordHasher(config.auth)
+        # token -> (username, session expiry)
+        self.token_cache = core.cache.TTLCache(config.auth.token_cache_size)
+        # Unknown tokens, so repeated guesses don't each reach Mongo.
+        self.negative_cache = core.cache.TTLCache(config.auth.negative_cache_size)
+        self.revocations_seen: datetime | None = None
+        # Signed tokens are checked against these instead of the database.
+        self.revoked_token_ids: dict[str, float] = {}
+        self.revoked_users: dict[str, float] = {}
+        if config.auth.mode == "signed" and config.auth.signing_key_id not in config.auth.signing_keys:
+            raise ValueError("auth.signing_key_id must name a key in auth.signing_keys")
+    async def create_credentials(self, username: str, password: str) -> bool:
+        """
+        Returns False if the username is taken. The lookup only spares hashing for names
+        already in use; the unique index settles concurrent registrations.
+        """
+        if await self.db["user_credentials"].find_one({"username": username}):
+            return False
+        hashed_password = await self.password_hasher.hash(password)
+        try:
+            await self.db["user_credentials"].insert_one({
+                "username": username,
+                "password": hashed_password
+            })
+        except DuplicateKeyError:
             return False
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
-        self.db["user_credentials"].insert_one({
-            "username": username,
-            "password": hashed_password
-        })
         return True
-    def verify_credentials(self, username: str, password: str) -> bool:
-        user = self.db["user_credentials"].find_one({"username": username})
-        if not user or user["password"] != hashlib.sha256(password.encode()).hexdigest():
+    @core.metrics.traced("auth.verify_credentials")
+    async def verify_credentials(self, username: str, password: str) -> bool:
+        """
+        Checks a login, rehashing the stored password when it uses legacy SHA-256 or outdated settings.
+        Raises core.passwords.HasherBusy when the hashing queue is full.
+        """
+        user = await self.db["user_credentials"].find_one({"username": username})
+        if not user:
+            return False
+        valid, new_hash = await self.password_hasher.verify(password, user["password"])
+        if not valid:
             return False
+        if new_hash:
+            await self.db["user_credentials"].update_one(
+                {"username": username, "password": user["password"]},
+                {"$set": {"password": new_hash}}
+            )
         return True
-    def create_auth_token(self, username: str) -> str:
+    @core.metrics.traced("auth.create_token")
+    async def create_auth_token(self, username: str) -> str:
+        if self.config.auth.mode == "signed":
+            return self.create_signed_token(username)
         token = secrets.token_urlsafe(32)
-        self.db["auth_tokens"].insert_one({
+        await self.db["auth_tokens"].insert_one({
             "token": token,
             "username": username,
-            "created_at": int(time.time())
+            # A BSON date, so the TTL index on created_at can expire the session.
+            "created_at": datetime.now(timezone.utc)
         })
         return token
-    def verify_auth_token(self, token: str) -> tuple[int, str | None]:
-        session = self.db["auth_tokens"].find_one({"token": token})
+    def create_signed_token(self, username: str) -> str:
+        """
+        Issues a stateless HMAC-signed token; its key id travels in the header so keys can rotate.
+        """
+        now = int(time.time())
+        return jwt.encode(
+            {
+                "sub": username,
+                "iat": now,
+                "exp": now + self.config.auth.session_ttl,
+                "jti": secrets.token_urlsafe(12)
+            },
+            self.config.auth.signing_keys[self.config.auth.signing_key_id],
+            algorithm=self.config.auth.signing_algorithm,
+            headers={"kid": self.config.auth.signing_key_id}
+        )
+    def decode_signed_token(self, token: str, verify_exp: bool = True) -> tuple[int, dict | None]:
+        try:
+            key = self.config.auth.signing_keys.get(jwt.get_unverified_header(token).get("kid"))
+            if key is None:
+                return 401, None
+            return 200, jwt.decode(
+                token,
+                key,
+                algorithms=[self.config.auth.signing_algorithm],
+                options={"verify_exp": verify_exp}
+            )
+        except ExpiredSignatureError:
+            return 403, None
+        except JWTError:
+            return 401, None
+    def verify_signed_token(self, token: str) -> tuple[int, str | None]:
+        """
+        Validates a signed token with no database access.
+        """
+        code, claims = self.decode_signed_token(token)
+        if claims is None:
+            return code, None
+        if claims.get("jti") in self.revoked_token_ids:
+            return 401, None
+        if claims["iat"] <= self.revoked_users.get(claims["sub"], 0):
+            return 401, None
+        return 200, claims["sub"]
+    @core.metrics.traced("auth.verify_token")
+    async def verify_auth_token(self, token: str) -> tuple[int, str | None]:
+        """
+        Validates a session or signed token, from the token cache when possible.
+        """
+        if token.count(".") == 2:
+            return self.verify_signed_token(token)
+        now = time.time()
+        cached = self.token_cache.get(token)
+        if cached is not None:
+            username, expires_at = cached
+            if expires_at < now:
+                return 403, None
+            return 200, username
+        if self.negative_cache.get(token) is not None:
+            return 401, None
+        session = await self.db["auth_tokens"].find_one({"token": token})
         if not session:
+            self.negative_cache.put(token, True, self.config.auth.negative_cache_ttl)
             return 401, None
-        if session["created_at"] + self.config.auth.session_ttl < int(time.time()):
+        expires_at = to_timestamp(session["created_at"]) + self.config.auth.session_ttl
+        if expires_at < int(now):
             return 403, None
+        self.token_cache.put(
+            token,
+            (session["username"], expires_at),
+            min(self.config.auth.token_cache_ttl, expires_at - now)
+        )
         return 200, session["username"]
-    def verify_auth_header(self, auth_header: str | None) -> tuple[int, str | None]:
+    def cached_username(self, token: str) -> str | None:
+        """
+        The token's user if that is known without touching the database, else None.
+        """
+        if token.count(".") == 2:
+            return self.verify_signed_token(token)[1]
+        cached = self.token_cache.get(token)
+        if cached is None or cached[1] < time.time():
+            return None
+        return cached[0]
+    async def verify_auth_header(self, auth_header: str | None) -> tuple[int, str | None]:
         if not auth_header or not auth_header.startswith("Bearer "):
             return 401, None
         token = auth_header.split(" ")[1]
-        return self.verify_auth_token(token)
+        return await self.verify_auth_token(token)
+    async def revoke_token(self, token: str) -> bool:
+        """
+        Ends a session. Other workers drop it from their caches on their next revocation poll.
+        """
+        if token.count(".") == 2:
+            _, claims = self.decode_signed_token(token, verify_exp=False)
+            if claims is None:
+                return False
+            self.revoked_token_ids[claims["jti"]] = claims["exp"]
+            await self.record_revocation({"token_id": claims["jti"], "expires_at": claims["exp"]})
+            return True
+        result = await self.db["auth_tokens"].delete_one({"token": token})
+        self.token_cache.invalidate(token)
+        if result.deleted_count == 0:
+            return False
+        await self.record_revocation({"token": token})
+        return True
+    async def revoke_user_tokens(self, username: str) -> int:
+        """
+        Ends every session of a user.
+        """
+        result = await self.db["auth_tokens"].delete_many({"username": username})
+        self.token_cache.invalidate_where(lambda entry: entry[0] == username)
+        self.revoked_users[username] = time.time()
+        await self.record_revocation({"username": username})
+        return result.deleted_count
+    async def record_revocation(self, revocation: dict) -> None:
+        # revoked_at comes from the server clock so every worker orders revocations the same way.
+        await self.db["revocations"].update_one(
+            {"_id": ObjectId()},
+            {"$set": revocation, "$currentDate": {"revoked_at": True}},
+            upsert=True
+        )
+    async def poll_revocations(self) -> int:
+        """
+        Applies revocations recorded since the last poll to the token cache and the signed token revocation list.
+        On the first poll every live revocation is loaded, since signed tokens issued before startup may be revoked.
+        """
+        query = {"revoked_at": {"$gte": self.revocations_seen}} if self.revocations_seen else {}
+        revocations = await self.db["revocations"].find(query, {"_id": 0}).sort("revoked_at", 1).to_list(None)
+        now = time.time()
+        for revocation in revocations:
+            if "token" in revocation:
+                self.token_cache.invalidate(revocation["token"])
+            elif "token_id" in revocation:
+                self.revoked_token_ids[revocation["token_id"]] = revocation["expires_at"]
+            else:
+                username = revocation["username"]
+                self.token_cache.invalidate_where(lambda entry: entry[0] == username)
+                self.revoked_users[username] = max(
+                    self.revoked_users.get(username, 0),
+                    to_timestamp(revocation["revoked_at"])
+                )
+            self.revocations_seen = revocation["revoked_at"]
+        if self.revocations_seen is None:
+            self.revocations_seen = datetime(1970, 1, 1)
+        # Revoked signed tokens only need remembering until they expire.
+        self.revoked_token_ids = {jti: exp for jti, exp in self.revoked_token_ids.items() if exp > now}
+        self.revoked_users = {
+            username: revoked_at for username, revoked_at in self.revoked_users.items()
+            if revoked_at + self.config.auth.session_ttl > now
+        }
+        return len(revocations)
+    async def watch_revocations(self, stop: asyncio.Event) -> None:
+        """
+        Polls the revocations collection until stop is set.
+        """
+        while not stop.is_set():
+            try:
+                await self.poll_revocations()
+            except Exception:
+                logger.exception("Revocation poll failed")
+            try:
+                await asyncio.wait_for(stop.wait(), self.config.auth.revocation_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+    def cache_stats(self) -> dict[str, dict[str, int]]:
+        return {
+            "tokens": self.token_cache.stats(),
+            "negative": self.negative_cache.stats()
+        }
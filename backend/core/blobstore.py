@@ -0,0 +1,162 @@
+"""
+Content-addressed blob storage for MemeArena.
+Blobs are keyed by the SHA-256 of their bytes, so identical uploads are stored once.
+"""
+
+import core.config
+import asyncio
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import gridfs
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorGridFSBucket
+
+def content_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def file_content_key(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+class BlobStore:
+    async def put(self, data: bytes) -> str:
+        raise NotImplementedError
+    async def put_file(self, path: str) -> str:
+        return await self.put(await asyncio.to_thread(read_file, path))
+    async def put_source(self, source: bytes | str) -> str:
+        """
+        Stores bytes, or the contents of a file path, without loading large files into memory where possible.
+        """
+        return await self.put(source) if isinstance(source, bytes) else await self.put_file(source)
+    def local_path(self, key: str) -> str | None:
+        """
+        Returns a filesystem path to the blob when the backend keeps blobs on local disk.
+        """
+        return None
+    async def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+    async def open_view(self, key: str) -> memoryview | None:
+        """
+        Returns a read-only view over the blob without copying it where the backend allows.
+        """
+        data = await self.get(key)
+        return memoryview(data) if data is not None else None
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+    async def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str) -> None:
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+    def write(self, key: str, write_to) -> str:
+        """
+        Writes a blob through a temp file and an atomic rename, unless it already exists.
+        """
+        path = self.path(key)
+        if os.path.exists(path):
+            return key
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write_to(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return key
+    def copy_file(self, path: str) -> str:
+        def write_to(f):
+            with open(path, "rb") as source:
+                shutil.copyfileobj(source, f)
+        return self.write(file_content_key(path), write_to)
+    def read(self, key: str) -> bytes | None:
+        try:
+            return read_file(self.path(key))
+        except FileNotFoundError:
+            return None
+    async def put(self, data: bytes) -> str:
+        return await asyncio.to_thread(self.write, content_key(data), lambda f: f.write(data))
+    async def put_file(self, path: str) -> str:
+        return await asyncio.to_thread(self.copy_file, path)
+    def local_path(self, key: str) -> str | None:
+        path = self.path(key)
+        return path if os.path.exists(path) else None
+    async def get(self, key: str) -> bytes | None:
+        return await asyncio.to_thread(self.read, key)
+    async def open_view(self, key: str) -> memoryview | None:
+        try:
+            with open(self.path(key), "rb") as f:
+                return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (FileNotFoundError, ValueError):
+            return None
+    async def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+    async def delete(self, key: str) -> bool:
+        try:
+            os.unlink(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+class GridFSBlobStore(BlobStore):
+    def __init__(self, db: AsyncIOMotorDatabase, collection: str = "blobs") -> None:
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=collection)
+        self.files = db[f"{collection}.files"]
+    async def put(self, data: bytes) -> str:
+        key = content_key(data)
+        if await self.exists(key):
+            return key
+        try:
+            await self.bucket.upload_from_stream_with_id(key, key, data)
+        except gridfs.errors.FileExists:
+            pass
+        return key
+    async def put_file(self, path: str) -> str:
+        key = await asyncio.to_thread(file_content_key, path)
+        if await self.exists(key):
+            return key
+        try:
+            with open(path, "rb") as f:
+                await self.bucket.upload_from_stream_with_id(key, key, f)
+        except gridfs.errors.FileExists:
+            pass
+        return key
+    async def get(self, key: str) -> bytes | None:
+        try:
+            stream = await self.bucket.open_download_stream(key)
+        except gridfs.errors.NoFile:
+            return None
+        return await stream.read()
+    async def exists(self, key: str) -> bool:
+        return await self.files.find_one({"_id": key}, {"_id": 1}) is not None
+    async def delete(self, key: str) -> bool:
+        try:
+            await self.bucket.delete(key)
+            return True
+        except gridfs.errors.NoFile:
+            return False
+
+def factory(config: core.config.Config, db: AsyncIOMotorDatabase) -> BlobStore:
+    """
+    Creates the blob store selected by the [storage] config section.
+    """
+    if config.storage.backend == "local":
+        return LocalBlobStore(config.storage.path)
+    if config.storage.backend == "gridfs":
+        return GridFSBlobStore(db, collection=config.storage.gridfs_collection)
+    raise ValueError(f"Unknown storage backend: {config.storage.backend}")
@@ -0,0 +1,140 @@
+"""
+In-process caches for MemeArena.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+# Handed to coalesced waiters when the leading load failed, so they load for themselves.
+LOAD_FAILED = object()
+
+class ByteLRUCache:
+    """
+    LRU cache bounded by the total byte size of its values, for use on a single event loop.
+    Concurrent misses for the same key are coalesced into a single load.
+    """
+    def __init__(self, max_bytes: int, max_entry_bytes: int | None = None) -> None:
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes
+        self.entries: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        self.loading: dict[str, asyncio.Future] = {}
+        self.invalidated: set[str] = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+    def get(self, key: str) -> Any | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+    def put(self, key: str, value: Any, size: int) -> bool:
+        """
+        Adds an entry and evicts down to the byte budget.
+        """
+        if size > self.max_entry_bytes:
+            return False
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+        return True
+    def invalidate(self, key: str) -> bool:
+        if key in self.loading:
+            self.invalidated.add(key)
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        self.bytes -= entry[1]
+        return True
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[tuple[Any, int] | None]]) -> Any | None:
+        """
+        Returns the cached value for key, awaiting loader on a miss.
+        loader returns (value, size), or None when there is nothing to cache.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        self.misses += 1
+        pending = self.loading.get(key)
+        if pending is not None:
+            value = await asyncio.shield(pending)
+            if value is not LOAD_FAILED:
+                return value
+            loaded = await loader()
+            return loaded[0] if loaded is not None else None
+        pending = self.loading[key] = asyncio.get_running_loop().create_future()
+        value = LOAD_FAILED
+        try:
+            loaded = await loader()
+            value = None
+            if loaded is not None:
+                value, size = loaded
+                if key not in self.invalidated:
+                    self.put(key, value, size)
+            return value
+        finally:
+            del self.loading[key]
+            self.invalidated.discard(key)
+            pending.set_result(value)
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "entries": len(self.entries)
+        }
+
+class TTLCache:
+    """
+    LRU cache bounded by entry count, where every entry carries its own expiry.
+    """
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    def get(self, key: str) -> Any | None:
+        entry = self.entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+    def put(self, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        self.entries.pop(key, None)
+        self.entries[key] = (value, time.monotonic() + ttl)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    def invalidate(self, key: str) -> bool:
+        return self.entries.pop(key, None) is not None
+    def invalidate_where(self, predicate: Callable[[Any], bool]) -> int:
+        """
+        Drops every entry whose value matches predicate.
+        """
+        keys = [key for key, (value, _) in self.entries.items() if predicate(value)]
+        for key in keys:
+            del self.entries[key]
+        return len(keys)
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries
+        }
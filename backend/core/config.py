@@ -4,7 +4,7 @@ Author: github.com/bugbrekr
 Date: 31/08/2025
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import get_type_hints
 import toml
 
@@ -15,27 +15,161 @@ class SubConfig:
 @dataclass
 class Server(SubConfig):
     cors_allowed_origins: tuple[str] = tuple()
+    host: str = "0.0.0.0"
+    port: int = 8000
+    # 0 runs one worker per CPU.
+    workers: int = 0
+    graceful_timeout: float = 30.0
+    warmup: bool = True
+    health_timeout: float = 2.0
 
 @dataclass
 class MongoDB(SubConfig):
     uri: str
     db: str
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    max_idle_time_ms: int | None = None
+    wait_queue_timeout_ms: int | None = None
+    server_selection_timeout_ms: int = 5000
+    connect_timeout_ms: int = 5000
+    socket_timeout_ms: int | None = None
+    read_preference: str = "primary"
 
 @dataclass
 class Auth(SubConfig):
     session_ttl: int
     admin_username: str
+    token_cache_size: int = 10000
+    token_cache_ttl: int = 300
+    negative_cache_size: int = 10000
+    negative_cache_ttl: int = 30
+    revocation_poll_interval: float = 1.0
+    mode: str = "session"
+    signing_keys: dict[str, str] = field(default_factory=dict)
+    signing_key_id: str | None = None
+    signing_algorithm: str = "HS256"
+    password_scheme: str = "bcrypt"
+    bcrypt_rounds: int = 12
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536
+    argon2_parallelism: int = 1
+    scrypt_rounds: int = 16
+    hash_workers: int = 2
+    hash_queue_depth: int = 32
+
+@dataclass
+class Storage(SubConfig):
+    backend: str = "local"
+    path: str = "blobs"
+    gridfs_collection: str = "blobs"
+
+@dataclass
+class Cache(SubConfig):
+    enabled: bool = True
+    max_bytes: int = 64 * 1024 * 1024
+    max_entry_bytes: int = 4 * 1024 * 1024
+
+@dataclass
+class Transcode(SubConfig):
+    backend: str = "pillow"
+    ffmpeg_fallback: bool = True
+    workers: int = 2
+    queue_depth: int = 16
+    width: int = 800
+    height: int = 600
+    quality: int = 90
+    timeout: int = 30
+    renditions: tuple[tuple[str, int, int], ...] = (("thumb", 160, 120), ("feed", 480, 360))
+    webp: bool = True
+    webp_quality: int = 80
+
+@dataclass
+class Upload(SubConfig):
+    mode: str = "sync"
+    workers: int = 2
+    max_attempts: int = 3
+    retry_backoff: float = 5.0
+    lease_seconds: int = 120
+    poll_interval: float = 1.0
+    max_bytes: int = 10 * 1024 * 1024
+    spool_threshold: int = 1024 * 1024
+    chunk_size: int = 64 * 1024
+
+@dataclass
+class Leaderboard(SubConfig):
+    size: int = 10
+    rebuild_interval: float = 30.0
+
+@dataclass
+class Votes(SubConfig):
+    mode: str = "direct"
+    flush_interval_ms: int = 200
+    flush_max_events: int = 1000
+    transactions: bool = False
+
+@dataclass
+class RateLimit(SubConfig):
+    enabled: bool = True
+    backend: str = "memory"
+    # Proxies in front of the app that append to X-Forwarded-For; 0 ignores the header.
+    trusted_hops: int = 0
+    max_keys: int = 100000
+    # (method, route path, tokens per second, burst)
+    rules: tuple[tuple[str, str, float, int], ...] = (
+        ("POST", "/a/auth/login", 0.2, 5),
+        ("POST", "/a/auth/register", 0.05, 3),
+        ("POST", "/a/meme", 0.1, 5),
+        ("PUT", "/a/meme/{meme_id}/vote", 5.0, 20),
+        ("PUT", "/a/meme/votes", 1.0, 5)
+    )
+
+@dataclass
+class Dedup(SubConfig):
+    mode: str = "off"
+    threshold: int = 4
+
+@dataclass
+class Stream(SubConfig):
+    enabled: bool = True
+    broker: str = "memory"
+    tick_ms: int = 250
+    client_queue: int = 64
+    heartbeat_seconds: float = 15.0
+    retention: int = 300
+
+@dataclass
+class Metrics(SubConfig):
+    enabled: bool = True
+    path: str = "/metrics"
+    trace_sample_rate: float = 0.0
 
 @dataclass
 class Config:
     server: Server
     mongodb: MongoDB
     auth: Auth
+    storage: Storage
+    cache: Cache
+    transcode: Transcode
+    upload: Upload
+    leaderboard: Leaderboard
+    votes: Votes
+    rate_limit: RateLimit
+    dedup: Dedup
+    stream: Stream
+    metrics: Metrics
     def __init__(self, config: dict[str, dict[str, str]]):
         registered_types = get_type_hints(self)
         for k, v in config.items():
             if k in registered_types:
                 setattr(self, k, registered_types[k](**v))
+        for k, t in registered_types.items():
+            if not hasattr(self, k):
+                try:
+                    setattr(self, k, t())
+                except TypeError:
+                    pass
 
 def load_config(config_file: str = "config.toml") -> Config:
     """
@@ -1,7 +1,20 @@
-import pymongo
+import core.config
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
 
-def factory(uri: str, db_name: str):
+def create_client(config: core.config.MongoDB, event_listeners: list[monitoring.CommandListener] | None = None) -> AsyncIOMotorClient:
     """
-    Creates a MongoDB database client.
+    Creates the process-wide async MongoDB client with the configured pool settings.
     """
-    return pymongo.MongoClient(uri)[db_name]
+    return AsyncIOMotorClient(
+        config.uri,
+        maxPoolSize=config.max_pool_size,
+        minPoolSize=config.min_pool_size,
+        maxIdleTimeMS=config.max_idle_time_ms,
+        waitQueueTimeoutMS=config.wait_queue_timeout_ms,
+        serverSelectionTimeoutMS=config.server_selection_timeout_ms,
+        connectTimeoutMS=config.connect_timeout_ms,
+        socketTimeoutMS=config.socket_timeout_ms,
+        readPreference=config.read_preference,
+        event_listeners=event_listeners or []
+    )
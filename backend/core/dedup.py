@@ -0,0 +1,102 @@
+"""
+Near-duplicate detection for MemeArena uploads.
+Every meme stores a 64-bit difference hash (dHash) of its image, split into four 16-bit
+bands kept in one indexed array. Two hashes within Hamming distance t share at least
+one band that differs in no more than t // 4 bits, so probing each band and, for
+thresholds of 4 and up, its one-bit neighbours finds every match in one indexed query.
+"""
+
+import core.config
+import io
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from PIL import Image, ImageOps
+
+MODES = ("off", "reject", "link")
+HASH_SIZE = 8
+BANDS = 4
+BAND_BITS = 16
+BAND_MASK = (1 << BAND_BITS) - 1
+# Beyond this a band could differ in two bits, and the probe set grows quadratically.
+MAX_THRESHOLD = 2 * BANDS - 1
+# Matches what the feed shows, including memes stored before uploads had a status.
+CANDIDATE_QUERY = {"status": {"$nin": ["processing", "failed"]}}
+CANDIDATE_PROJECTION = {"_id": 0, "meme_id": 1, "phash": 1}
+DUPLICATE_PROJECTION = {"_id": 0, "meme_id": 1, "phash": 1, "duplicate_of": 1, "image": 1, "renditions": 1, "blob_keys": 1}
+
+class DuplicateUpload(Exception):
+    """
+    Raised when an upload is a near-duplicate of an existing meme.
+    """
+    def __init__(self, meme: dict, phash: int) -> None:
+        super().__init__(meme["meme_id"])
+        self.meme = meme
+        self.phash = phash
+
+def dhash(source: bytes | str, width: int, height: int) -> int:
+    """
+    Difference hash of an image: one bit per horizontally adjacent pixel pair of a 9x8
+    grayscale thumbnail. The image is first letterboxed to the width:height canvas the
+    transcoder pads memes onto, so an upload and its stored rendition hash alike.
+    Runs inside pool workers, so it stays module-level.
+    """
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as image:
+        # JPEGs decode at a fraction of their size, which is all a 9x8 thumbnail needs.
+        image.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+        image = ImageOps.exif_transpose(image).convert("L")
+        canvas = (HASH_SIZE * 8, max(1, round(HASH_SIZE * 8 * height / width)))
+        image = ImageOps.pad(image, canvas, Image.Resampling.BILINEAR, color=0)
+        pixels = image.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR).tobytes()
+    phash = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for column in range(HASH_SIZE):
+            phash = phash << 1 | (pixels[offset + column] > pixels[offset + column + 1])
+    return phash
+
+def to_int64(phash: int) -> int:
+    # BSON integers are signed.
+    return phash - (1 << 64) if phash >= 1 << 63 else phash
+
+def from_int64(value: int) -> int:
+    return value & ((1 << 64) - 1)
+
+def band_keys(phash: int) -> list[int]:
+    """
+    Each band's value tagged with its position, so equal values in different bands don't match.
+    """
+    return [band << BAND_BITS | (phash >> (band * BAND_BITS)) & BAND_MASK for band in range(BANDS)]
+
+def probe_keys(phash: int, threshold: int) -> list[int]:
+    keys = band_keys(phash)
+    if threshold < BANDS:
+        return keys
+    return keys + [key ^ (1 << bit) for key in keys for bit in range(BAND_BITS)]
+
+def hash_fields(phash: int) -> dict:
+    return {"phash": to_int64(phash), "phash_bands": band_keys(phash)}
+
+class DuplicateIndex:
+    def __init__(self, config: core.config.Config, db: AsyncIOMotorDatabase) -> None:
+        if config.dedup.mode not in MODES:
+            raise ValueError(f"Unknown dedup mode: {config.dedup.mode}")
+        if not 0 <= config.dedup.threshold <= MAX_THRESHOLD:
+            raise ValueError(f"Dedup threshold must be between 0 and {MAX_THRESHOLD}")
+        self.config = config
+        self.db = db
+    async def find(self, phash: int) -> dict | None:
+        """
+        Returns the closest ready meme within the configured Hamming distance, or None.
+        """
+        candidates = await self.db.memes.find(
+            {"phash_bands": {"$in": probe_keys(phash, self.config.dedup.threshold)}, **CANDIDATE_QUERY},
+            CANDIDATE_PROJECTION
+        ).to_list(None)
+        best, best_distance = None, self.config.dedup.threshold + 1
+        for meme in candidates:
+            distance = (from_int64(meme["phash"]) ^ phash).bit_count()
+            if distance < best_distance:
+                best, best_distance = meme, distance
+        if best is None:
+            return None
+        # Only the closest match needs its image fields, for linking.
+        return await self.db.memes.find_one({"meme_id": best["meme_id"], **CANDIDATE_QUERY}, DUPLICATE_PROJECTION)
@@ -1,18 +1,99 @@
 """
 Image processing utilities for MemeArena.
-Handles image format conversion and base64 encoding.
+Handles upload ingestion and conversion to the meme renditions.
 """
 
-import base64
-import subprocess
-import tempfile
+import core.config
+import core.dedup
+import core.transcode
+import asyncio
 import os
-from typing import Optional, Tuple
+import struct
+import tempfile
+from typing import Awaitable, Callable, Optional, Tuple
 from fastapi import UploadFile
-import uuid
+
+MAGIC_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff")
+]
+
+def sniff_image_type(head: bytes) -> str | None:
+    """
+    Identifies an image format from its leading magic bytes.
+    """
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+def jpeg_dimensions(data: bytes) -> Tuple[int, int] | None:
+    """
+    Reads (width, height) from the first SOF marker of a JPEG.
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            i += 1 if marker == 0xFF else 2
+            continue
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+class SpooledUpload:
+    """
+    Upload bytes kept in memory up to a threshold and spooled to a temp file beyond it.
+    """
+    def __init__(self, spool_threshold: int) -> None:
+        self.spool_threshold = spool_threshold
+        self.buffer = bytearray()
+        self.file = None
+        self.size = 0
+        self.content_type: str | None = None
+    def write(self, chunk: bytes) -> None:
+        if self.file is None and len(self.buffer) + len(chunk) > self.spool_threshold:
+            self.file = tempfile.NamedTemporaryFile(delete=False, suffix=".upload")
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+        if self.file is not None:
+            self.file.write(chunk)
+        else:
+            self.buffer += chunk
+        self.size += len(chunk)
+    def source(self) -> bytes | str:
+        """
+        Returns the upload as bytes, or as a file path once it has been spooled to disk.
+        """
+        if self.file is None:
+            return bytes(self.buffer)
+        self.file.flush()
+        return self.file.name
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            os.unlink(self.file.name)
+            self.file = None
+        self.buffer = bytearray()
 
 class ImageProcessor:
-    def __init__(self):
+    def __init__(self, config: core.config.Config):
+        self.config = config
         self.supported_formats = [
             "image/jpeg",
             "image/jpg",
@@ -22,51 +103,72 @@ class ImageProcessor:
             "image/bmp",
             "image/tiff"
         ]
+        self.engine = core.transcode.TranscodeEngine(config.transcode)
     def is_supported_format(self, content_type: str) -> bool:
         return content_type.lower() in self.supported_formats
-    async def process_image(self, file: UploadFile) -> Tuple[bool, Optional[str], Optional[str]]:
-        if not file.content_type or not self.is_supported_format(file.content_type):
-            return False, None, f"Unsupported file format: {file.content_type or "unknown"}"
-        
+    async def read_upload(self, file: UploadFile) -> Tuple[bool, Optional[SpooledUpload], Optional[str]]:
+        """
+        Reads an upload in chunks, rejecting oversized files and non-images from the first chunk.
+        The caller closes the returned SpooledUpload.
+        """
         if not file.filename:
             return False, None, "No filename provided"
         
+        max_bytes = self.config.upload.max_bytes
+        if file.size is not None and file.size > max_bytes:
+            return False, None, f"File exceeds {max_bytes} bytes"
+        
+        upload = SpooledUpload(self.config.upload.spool_threshold)
         try:
-            file_content = await file.read()
-            file_extension = file.filename.split(".")[-1] if "." in file.filename else "tmp"
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_input:
-                temp_input.write(file_content)
-                temp_input_path = temp_input.name
-            output_filename = f"{uuid.uuid4().hex}.jpg"
-            temp_output_path = os.path.join(tempfile.gettempdir(), output_filename)
-            
-            try:
-                result = subprocess.run([
-                    "ffmpeg", "-i", temp_input_path,
-                    "-vf", "scale=800:600:force_original_aspect_ratio=decrease,pad=800:600:(ow-iw)/2:(oh-ih)/2",
-                    "-q:v", "2",
-                    "-y",
-                    temp_output_path
-                ], capture_output=True, text=True, timeout=30)
-                
-                if result.returncode != 0:
-                    return False, None, f"FFmpeg conversion failed: {result.stderr}"
-                
-                with open(temp_output_path, "rb") as jpg_file:
-                    jpg_data = jpg_file.read()
-                    base64_data = base64.b64encode(jpg_data).decode("utf-8")
-                
-                return True, base64_data, None
-                
-            finally:
-                if os.path.exists(temp_input_path):
-                    os.unlink(temp_input_path)
-                if os.path.exists(temp_output_path):
-                    os.unlink(temp_output_path)
-                    
-        except subprocess.TimeoutExpired:
-            return False, None, "Image processing timed out"
-        except Exception as e:
-            return False, None, f"Image processing error: {str(e)}"
+            while chunk := await file.read(self.config.upload.chunk_size):
+                if upload.content_type is None:
+                    upload.content_type = sniff_image_type(chunk)
+                    if upload.content_type is None or not self.is_supported_format(upload.content_type):
+                        upload.close()
+                        return False, None, f"Unsupported file format: {file.content_type or 'unknown'}"
+                if upload.size + len(chunk) > max_bytes:
+                    upload.close()
+                    return False, None, f"File exceeds {max_bytes} bytes"
+                upload.write(chunk)
+        except BaseException:
+            upload.close()
+            raise
         finally:
             await file.seek(0)
+        if upload.size == 0:
+            return False, None, "Empty file"
+        return True, upload, None
+    async def process_image(
+            self,
+            file: UploadFile,
+            find_duplicate: Callable[[int], Awaitable[dict | None]] | None = None
+        ) -> Tuple[bool, Optional[dict[str, dict[str, bytes]]], Optional[str], Optional[int]]:
+        """
+        Converts an upload to the standard meme renditions, keyed by name and then format,
+        and returns them with the upload's perceptual hash when find_duplicate is given.
+        find_duplicate is checked before transcoding; a match raises core.dedup.DuplicateUpload.
+        Raises core.transcode.TranscoderBusy when the transcode pool is saturated.
+        """
+        success, upload, error = await self.read_upload(file)
+        if not success:
+            return False, None, error, None
+        
+        try:
+            phash = None
+            if find_duplicate is not None:
+                phash = await self.engine.fingerprint(upload.source())
+                duplicate = await find_duplicate(phash) if phash is not None else None
+                if duplicate is not None:
+                    raise core.dedup.DuplicateUpload(duplicate, phash)
+            renditions = await self.engine.transcode(upload.source())
+            return True, renditions, None, phash
+        except (core.transcode.TranscoderBusy, core.dedup.DuplicateUpload):
+            raise
+        except asyncio.TimeoutError:
+            return False, None, "Image processing timed out", None
+        except core.transcode.TranscodeError as e:
+            return False, None, str(e), None
+        except Exception as e:
+            return False, None, f"Image processing error: {str(e)}", None
+        finally:
+            upload.close()
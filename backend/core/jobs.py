@@ -0,0 +1,190 @@
+"""
+Persistent upload job queue for MemeArena.
+Jobs live in the Mongo "jobs" collection so queued uploads survive restarts.
+"""
+
+import core.config
+import core.image_utils
+import core.meme
+import core.transcode
+import asyncio
+import logging
+import secrets
+import time
+import pymongo
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    def __init__(self, config: core.config.Config, db: AsyncIOMotorDatabase) -> None:
+        self.config = config
+        self.db = db
+    async def enqueue(self, meme_id: str, raw_key: str) -> str:
+        job_id = secrets.token_urlsafe(16)
+        now = time.time()
+        await self.db.jobs.insert_one({
+            "job_id": job_id,
+            "meme_id": meme_id,
+            "raw_key": raw_key,
+            "status": "queued",
+            "attempts": 0,
+            "error": None,
+            "available_at": now,
+            "lease_until": None,
+            "created_at": now,
+            "updated_at": now
+        })
+        return job_id
+    async def claim(self) -> dict | None:
+        """
+        Atomically takes the oldest runnable job, including jobs whose worker lease expired
+        with attempts to spare.
+        """
+        now = time.time()
+        return await self.db.jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "available_at": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$lt": self.config.upload.max_attempts}}
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_until": now + self.config.upload.lease_seconds,
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", pymongo.ASCENDING)],
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+    async def reap(self) -> list[dict]:
+        """
+        Dead-letters jobs whose lease expired on their last attempt: each one killed or
+        stalled its worker every time, so it never reached fail(). Returns those jobs.
+        """
+        reaped = []
+        while True:
+            now = time.time()
+            job = await self.db.jobs.find_one_and_update(
+                {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$gte": self.config.upload.max_attempts}},
+                {"$set": {"status": "dead", "error": "Worker lease expired", "lease_until": None, "updated_at": now}},
+                return_document=pymongo.ReturnDocument.AFTER
+            )
+            if job is None:
+                return reaped
+            reaped.append(job)
+    async def complete(self, job_id: str) -> None:
+        await self.db.jobs.update_one(
+            {"job_id": job_id},
+            {"$set": {"status": "done", "lease_until": None, "updated_at": time.time()}}
+        )
+    async def release(self, job_id: str, delay: float) -> None:
+        """
+        Puts a job back on the queue without counting the attempt.
+        """
+        now = time.time()
+        await self.db.jobs.update_one(
+            {"job_id": job_id},
+            {
+                "$set": {"status": "queued", "available_at": now + delay, "lease_until": None, "updated_at": now},
+                "$inc": {"attempts": -1}
+            }
+        )
+    async def fail(self, job: dict, error: str) -> bool:
+        """
+        Records a failed attempt. Returns True when the job was moved to the dead-letter state.
+        """
+        now = time.time()
+        dead = job["attempts"] >= self.config.upload.max_attempts
+        await self.db.jobs.update_one(
+            {"job_id": job["job_id"]},
+            {"$set": {
+                "status": "dead" if dead else "queued",
+                "error": error,
+                "available_at": now + self.config.upload.retry_backoff * 2 ** (job["attempts"] - 1),
+                "lease_until": None,
+                "updated_at": now
+            }}
+        )
+        return dead
+    async def get_job(self, meme_id: str) -> dict | None:
+        return await self.db.jobs.find_one(
+            {"meme_id": meme_id},
+            {"_id": 0},
+            sort=[("created_at", pymongo.DESCENDING)]
+        )
+    async def raw_key_in_use(self, raw_key: str) -> bool:
+        return await self.db.jobs.find_one(
+            {"raw_key": raw_key, "status": {"$in": ["queued", "running"]}},
+            {"_id": 1}
+        ) is not None
+    async def depth(self) -> int:
+        return await self.db.jobs.count_documents({"status": {"$in": ["queued", "running"]}})
+
+class UploadWorker:
+    """
+    Drains the job queue, transcoding raw uploads into finished memes.
+    """
+    def __init__(
+            self,
+            config: core.config.Config,
+            job_queue: JobQueue,
+            meme_manager: core.meme.MemeManager,
+            image_processor: core.image_utils.ImageProcessor
+        ) -> None:
+        self.config = config
+        self.job_queue = job_queue
+        self.meme_manager = meme_manager
+        self.image_processor = image_processor
+    async def run(self, stop: asyncio.Event) -> None:
+        """
+        Claims and processes jobs until stop is set. A job whose processing fails is
+        claimed again once its lease runs out.
+        """
+        while not stop.is_set():
+            try:
+                for job in await self.job_queue.reap():
+                    logger.warning("Upload job %s dead after %d expired leases", job["job_id"], job["attempts"])
+                    await self.meme_manager.fail_meme(job["meme_id"])
+                job = await self.job_queue.claim()
+                if job is not None:
+                    await self.process(job)
+                    continue
+            except Exception:
+                logger.exception("Upload worker iteration failed")
+            try:
+                await asyncio.wait_for(stop.wait(), self.config.upload.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+    async def process(self, job: dict) -> None:
+        blob_store = self.meme_manager.blob_store
+        source = blob_store.local_path(job["raw_key"]) or await blob_store.get(job["raw_key"])
+        if source is None:
+            await self.finish(job, None, "Raw upload is missing")
+            return
+        try:
+            renditions = await self.image_processor.engine.transcode(source)
+        except core.transcode.TranscoderBusy:
+            await self.job_queue.release(job["job_id"], self.config.upload.poll_interval)
+            return
+        except Exception as e:
+            logger.warning("Upload job %s failed: %s", job["job_id"], e)
+            await self.finish(job, None, str(e) or type(e).__name__)
+            return
+        await self.finish(job, renditions, None)
+    async def finish(self, job: dict, renditions: dict[str, dict[str, bytes]] | None, error: str | None) -> None:
+        """
+        Completes or fails a job. Raw uploads of dead jobs are kept for inspection.
+        """
+        if renditions is None:
+            if await self.job_queue.fail(job, error):
+                await self.meme_manager.fail_meme(job["meme_id"])
+            return
+        await self.meme_manager.complete_meme(job["meme_id"], renditions)
+        await self.job_queue.complete(job["job_id"])
+        if not await self.job_queue.raw_key_in_use(job["raw_key"]):
+            await self.meme_manager.release_image(job["raw_key"])
+
+def start_workers(worker: UploadWorker, count: int, stop: asyncio.Event) -> list[asyncio.Task]:
+    return [asyncio.create_task(worker.run(stop)) for _ in range(count)]
@@ -0,0 +1,128 @@
+"""
+In-memory leaderboards for MemeArena.
+Each window keeps the top memes plus a margin of runners-up, updated as memes are
+added, voted on and deleted, and rebuilt from Mongo periodically to pick up writes
+from other workers.
+"""
+
+import core.config
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import pymongo
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = {"day": 24 * 3600, "week": 7 * 24 * 3600, "all": None}
+SUMMARY_FIELDS = ("meme_id", "title", "username", "votes", "created_at")
+
+class TopK:
+    """
+    Tracks the highest-voted memes of one window, keeping twice as many as it serves
+    so a tracked meme losing votes doesn't leave a gap before the next rebuild.
+    """
+    def __init__(self, size: int, window: int | None) -> None:
+        self.size = size
+        self.capacity = size * 2
+        self.window = window
+        self.entries: dict[str, dict] = {}
+    def eligible(self, meme: dict, now: float) -> bool:
+        return self.window is None or meme["created_at"] >= now - self.window
+    def update(self, meme: dict, now: float) -> bool:
+        """
+        Applies a meme's current state. Returns True if the tracked set changed.
+        """
+        meme_id = meme["meme_id"]
+        if not self.eligible(meme, now):
+            return self.entries.pop(meme_id, None) is not None
+        if meme_id not in self.entries and len(self.entries) >= self.capacity:
+            lowest = min(self.entries.values(), key=rank)
+            if rank(meme) <= rank(lowest):
+                return False
+            del self.entries[lowest["meme_id"]]
+        self.entries[meme_id] = meme
+        return True
+    def remove(self, meme_id: str) -> bool:
+        return self.entries.pop(meme_id, None) is not None
+    def adjust(self, meme_id: str, delta: int) -> bool:
+        """
+        Changes the vote count of a tracked meme. Untracked memes are picked up by the next rebuild.
+        """
+        meme = self.entries.get(meme_id)
+        if meme is None:
+            return False
+        self.entries[meme_id] = {**meme, "votes": meme["votes"] + delta}
+        return True
+    def replace(self, memes: list[dict]) -> None:
+        self.entries = {meme["meme_id"]: meme for meme in memes}
+    def top(self, now: float) -> list[dict]:
+        memes = [meme for meme in self.entries.values() if self.eligible(meme, now)]
+        return sorted(memes, key=rank, reverse=True)[:self.size]
+
+def rank(meme: dict) -> tuple[int, str]:
+    return meme["votes"], meme["meme_id"]
+
+def summary(meme: dict) -> dict:
+    return {field: meme[field] for field in SUMMARY_FIELDS}
+
+class Leaderboard:
+    def __init__(self, config: core.config.Config, db: AsyncIOMotorDatabase, vote_buffer=None) -> None:
+        self.config = config
+        self.db = db
+        # Counts loaded on rebuild are read through the vote buffer when votes are written behind.
+        self.vote_buffer = vote_buffer
+        self.boards = {
+            name: TopK(config.leaderboard.size, window)
+            for name, window in WINDOWS.items()
+        }
+    def update(self, meme: dict) -> None:
+        now = time.time()
+        for board in self.boards.values():
+            board.update(summary(meme), now)
+    def remove(self, meme_id: str) -> None:
+        for board in self.boards.values():
+            board.remove(meme_id)
+    def adjust(self, meme_id: str, delta: int) -> None:
+        for board in self.boards.values():
+            board.adjust(meme_id, delta)
+    def top(self, window: str) -> list[dict]:
+        return self.boards[window].top(time.time())
+    async def rebuild(self) -> None:
+        """
+        Reloads every window from Mongo.
+        """
+        now = time.time()
+        for name, board in self.boards.items():
+            query = {"status": {"$nin": ["processing", "failed"]}}
+            if board.window is not None:
+                query["created_at"] = {"$gte": now - board.window}
+            memes = await self.db.memes.find(
+                query,
+                {"_id": 0, **{field: 1 for field in SUMMARY_FIELDS}}
+            ).sort([("votes", pymongo.DESCENDING), ("meme_id", pymongo.DESCENDING)]).limit(board.capacity).to_list(None)
+            if self.vote_buffer is not None:
+                for meme in memes:
+                    meme["votes"] += self.vote_buffer.pending(meme["meme_id"])
+            board.replace(memes)
+    async def run(self, stop: asyncio.Event) -> None:
+        """
+        Rebuilds the leaderboards every rebuild_interval seconds until stop is set.
+        """
+        while not stop.is_set():
+            try:
+                await self.rebuild()
+            except Exception:
+                logger.exception("Leaderboard rebuild failed")
+            try:
+                await asyncio.wait_for(stop.wait(), self.config.leaderboard.rebuild_interval)
+            except asyncio.TimeoutError:
+                pass
+
+def make_version(memes: list[dict]) -> str:
+    """
+    Content hash of a leaderboard response, identical across workers that agree on the ranking.
+    """
+    return hashlib.sha256(json.dumps(memes, sort_keys=True).encode()).hexdigest()[:16]
@@ -1,76 +1,576 @@
 import core.config
-import core.database
+import core.metrics
+import core.blobstore
+import core.cache
+import core.dedup
+import core.image_utils
+import core.leaderboard
+import core.stream
+import core.votes
+import asyncio
 import time
+import base64
+import binascii
+import json
+import math
 import secrets
+import pymongo
+import pymongo.errors
 from bson import ObjectId
-from typing import List, Dict, Optional
+from typing import Any, Awaitable, Callable, List, Dict, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+# Seconds of age worth one order of magnitude of votes in the hot ranking.
+HOT_DECAY_SECONDS = 45000
+SORT_FIELDS = {"new": "created_at", "top": "votes", "hot": "hot"}
+FEED_QUERY = {"status": {"$nin": ["processing", "failed"]}}
+FEED_PROJECTION = {"_id": 0, "meme_id": 1, "title": 1, "username": 1, "votes": 1, "created_at": 1}
+# Most ids or votes one batch request may carry.
+BATCH_LIMIT = 100
+LEADERBOARD_PROJECTION = {"_id": 0, "status": 1, **{field: 1 for field in core.leaderboard.SUMMARY_FIELDS}}
+
+def hot_score(votes: int, created_at: float) -> float:
+    """
+    Time-decayed score: newer memes outrank older ones unless the older ones have many more votes.
+    It only changes when votes do, so it can be stored and indexed.
+    """
+    sign = (votes > 0) - (votes < 0)
+    return sign * math.log10(max(abs(votes), 1)) + created_at / HOT_DECAY_SECONDS
+
+# hot_score as an update pipeline expression, so votes and hot change in one atomic update.
+HOT_SCORE_EXPR = {"$add": [
+    {"$multiply": [
+        {"$cond": [{"$gt": ["$votes", 0]}, 1, {"$cond": [{"$lt": ["$votes", 0]}, -1, 0]}]},
+        {"$log10": {"$max": [{"$abs": "$votes"}, 1]}}
+    ]},
+    {"$divide": ["$created_at", HOT_DECAY_SECONDS]}
+]}
+
+def encode_cursor(sort_value: Any, meme_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, meme_id]).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[Any, str]:
+    try:
+        sort_value, meme_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(sort_value, (int, float)) or not isinstance(meme_id, str):
+        raise ValueError("Invalid cursor")
+    return sort_value, meme_id
+
+def rendition_blobs(renditions: dict[str, dict[str, bytes]]) -> dict[str, bytes]:
+    return {core.blobstore.content_key(data): data for formats in renditions.values() for data in formats.values()}
+
+def meme_keys(meme: dict) -> list[str]:
+    keys = set(meme.get("blob_keys", []))
+    if "image" in meme:
+        keys.add(meme["image"]["key"])
+    return sorted(keys)
 
 class MemeManager:
-    def __init__(self, config: core.config.Config) -> None:
-        self.db = core.database.factory(
-            config.mongodb.uri,
-            config.mongodb.db
-        )
-    def add_meme(
+    def __init__(self, config: core.config.Config, db: AsyncIOMotorDatabase) -> None:
+        self.config = config
+        self.db = db
+        self.blob_store = core.blobstore.factory(config, db)
+        self.image_cache = core.cache.ByteLRUCache(
+            config.cache.max_bytes,
+            config.cache.max_entry_bytes
+        ) if config.cache.enabled else None
+        self.vote_buffer = core.votes.VoteBuffer(config, db) if config.votes.mode == "buffered" else None
+        self.leaderboard = core.leaderboard.Leaderboard(config, db, vote_buffer=self.vote_buffer)
+        self.events = core.stream.EventHub(
+            config,
+            db,
+            on_deleted=self.invalidate_images
+        ) if config.stream.enabled else None
+        self.duplicates = core.dedup.DuplicateIndex(config, db) if config.dedup.mode != "off" else None
+    async def store_image(self, image_data: bytes, width: int | None = None, height: int | None = None) -> dict:
+        key = await self.blob_store.put(image_data)
+        if width is None:
+            width, height = core.image_utils.jpeg_dimensions(image_data) or (None, None)
+        return {
+            "key": key,
+            "size": len(image_data),
+            "width": width,
+            "height": height
+        }
+    @core.metrics.traced("meme.store_renditions")
+    async def store_renditions(self, renditions: dict[str, dict[str, bytes]]) -> dict:
+        """
+        Stores every rendition and returns the image fields for a meme document.
+        "image" stays the full-size JPEG; "blob_keys" lists every blob the meme references.
+        """
+        stored = {}
+        for name, formats in renditions.items():
+            width, height = core.image_utils.jpeg_dimensions(formats["jpeg"]) or (None, None)
+            stored[name] = {
+                image_format: await self.store_image(image_data, width, height)
+                for image_format, image_data in formats.items()
+            }
+        return {
+            "image": stored["full"]["jpeg"],
+            "renditions": stored,
+            "blob_keys": sorted({ref["key"] for formats in stored.values() for ref in formats.values()})
+        }
+    def rendition_names(self) -> list[str]:
+        return ["full"] + [name for name, _, _ in self.config.transcode.renditions]
+    @core.metrics.traced("meme.add")
+    async def add_meme(
             self,
             title: str,
-            base64_data: str,
-            username: str
+            renditions: dict[str, dict[str, bytes]],
+            username: str,
+            phash: int | None = None
         ) -> str:
+        images = await self.store_renditions(renditions)
+        if phash is not None:
+            images.update(core.dedup.hash_fields(phash))
+        return await self.insert_ready_meme(title, username, images, rendition_blobs(renditions))
+    async def add_linked_meme(self, title: str, original: dict, username: str, phash: int) -> str | None:
+        """
+        Creates a meme for a near-duplicate upload that shares the original's stored images.
+        Returns None if the original's images were released meanwhile.
+        """
+        fields = {field: original[field] for field in ("image", "renditions", "blob_keys") if field in original}
+        return await self.insert_ready_meme(title, username, {
+            **fields,
+            **core.dedup.hash_fields(phash),
+            "duplicate_of": original.get("duplicate_of", original["meme_id"])
+        }, {})
+    async def insert_ready_meme(self, title: str, username: str, fields: dict, blobs: dict[str, bytes]) -> str | None:
+        """
+        Inserts a ready meme, then makes sure every blob it references still exists, putting
+        back from blobs (key -> bytes) any a concurrent release deleted. Returns None, having
+        removed the meme again, if one is missing and not in blobs.
+        """
         meme_id = secrets.token_urlsafe(16)
+        created_at = time.time()
         meme_data = {
             "meme_id": meme_id,
             "title": title,
-            "image_data": base64_data,
+            **fields,
             "username": username,
             "votes": 0,
-            "created_at": time.time()
+            "hot": hot_score(0, created_at),
+            "status": "ready",
+            "created_at": created_at
         }
-        self.db.memes.insert_one(meme_data)
+        await self.db.memes.insert_one(meme_data)
+        if not await self.keep_blobs(meme_keys(meme_data), blobs):
+            await self.db.memes.delete_one({"meme_id": meme_id})
+            return None
+        self.leaderboard.update(meme_data)
+        if self.events is not None:
+            self.events.add(meme_data)
         return meme_id
-    def get_meme(self, meme_id: str) -> dict | None:
-        return self.db.memes.find_one({"meme_id": meme_id}, {"_id": 0})
-    def vote_meme(self, meme_id: str, upvote: bool, clicked: bool, username: str) -> bool:
-        profile = self.db["profiles"].find_one({"username": username})
-        if not profile:
-            return False
-        if profile.get("voted_memes", {}).get(meme_id) == upvote and clicked:
+    async def add_pending_meme(self, title: str, username: str, phash: int | None = None) -> str:
+        """
+        Creates a meme whose image is still being processed by an upload job.
+        """
+        meme_id = secrets.token_urlsafe(16)
+        created_at = time.time()
+        await self.db.memes.insert_one({
+            "meme_id": meme_id,
+            "title": title,
+            "username": username,
+            "votes": 0,
+            "hot": hot_score(0, created_at),
+            "status": "processing",
+            "created_at": created_at,
+            **(core.dedup.hash_fields(phash) if phash is not None else {})
+        })
+        return meme_id
+    async def complete_meme(self, meme_id: str, renditions: dict[str, dict[str, bytes]]) -> bool:
+        images = await self.store_renditions(renditions)
+        meme = await self.db.memes.find_one_and_update(
+            {"meme_id": meme_id, "status": "processing"},
+            {"$set": {**images, "status": "ready"}},
+            projection=LEADERBOARD_PROJECTION,
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        if meme is None:
+            for key in images["blob_keys"]:
+                await self.release_image(key)
             return False
-        elif profile.get("voted_memes", {}).get(meme_id) is None and not clicked:
+        await self.keep_blobs(images["blob_keys"], rendition_blobs(renditions))
+        self.leaderboard.update(meme)
+        if self.events is not None:
+            self.events.add(meme)
+        return True
+    async def fail_meme(self, meme_id: str) -> bool:
+        result = await self.db.memes.update_one(
+            {"meme_id": meme_id, "status": "processing"},
+            {"$set": {"status": "failed"}}
+        )
+        return result.modified_count > 0
+    async def get_meme_status(self, meme_id: str) -> str | None:
+        meme = await self.db.memes.find_one({"meme_id": meme_id}, {"_id": 0, "status": 1})
+        if not meme:
+            return None
+        return meme.get("status", "ready")
+    async def get_meme(self, meme_id: str) -> dict | None:
+        return await self.db.memes.find_one({"meme_id": meme_id}, {"_id": 0})
+    @core.metrics.traced("meme.load_image")
+    async def load_image(self, meme_id: str, size: str = "full", accept_webp: bool = False) -> tuple[str, str, memoryview] | None:
+        """
+        Returns the content key, format and a view over the stored rendition of a meme.
+        WebP is chosen when accepted and available. Served from the image cache when
+        enabled, else from an mmap of the blob.
+        """
+        if size not in self.rendition_names():
+            return None
+        preferred_format = "webp" if accept_webp else "jpeg"
+        if self.image_cache is None:
+            image = await self.read_image(meme_id, size, preferred_format, self.blob_store.open_view)
+        else:
+            image = await self.image_cache.get_or_load(
+                f"{meme_id}:{size}:{preferred_format}",
+                lambda: self.read_cacheable_image(meme_id, size, preferred_format)
+            )
+        if image is None:
+            return None
+        key, image_format, image_data = image
+        return key, image_format, memoryview(image_data)
+    async def read_cacheable_image(self, meme_id: str, size: str, preferred_format: str) -> tuple[tuple[str, str, bytes], int] | None:
+        image = await self.read_image(meme_id, size, preferred_format, self.blob_store.get)
+        if image is None:
+            return None
+        return image, len(image[2])
+    async def read_image(self, meme_id: str, size: str, preferred_format: str, reader: Callable[[str], Awaitable[Any]]) -> tuple[str, str, Any] | None:
+        meme = await self.db.memes.find_one(
+            {"meme_id": meme_id},
+            {"_id": 0, "image.key": 1, f"renditions.{size}": 1, "image_data": 1}
+        )
+        if not meme:
+            return None
+        formats = meme.get("renditions", {}).get(size)
+        if formats:
+            image_format = preferred_format if preferred_format in formats else "jpeg"
+            key = formats[image_format]["key"]
+        elif "image" in meme:
+            # Stored before renditions existed: only the full JPEG is available.
+            image_format, key = "jpeg", meme["image"]["key"]
+        elif "image_data" in meme:
+            image_data = base64.b64decode(meme["image_data"])
+            return core.blobstore.content_key(image_data), "jpeg", image_data
+        else:
+            return None
+        image_data = await reader(key)
+        return (key, image_format, image_data) if image_data is not None else None
+    def invalidate_images(self, meme_id: str) -> None:
+        if self.image_cache is None:
+            return
+        for size in self.rendition_names():
+            for image_format in ("jpeg", "webp"):
+                self.image_cache.invalidate(f"{meme_id}:{size}:{image_format}")
+    async def warm(self) -> None:
+        """
+        Loads the leaderboards and caches their memes' images before the first request needs them.
+        """
+        await self.leaderboard.rebuild()
+        if self.image_cache is None:
+            return
+        meme_ids = {meme["meme_id"] for window in core.leaderboard.WINDOWS for meme in self.leaderboard.top(window)}
+        # Browsers accept WebP, so those are the entries real requests will hit.
+        await asyncio.gather(*(
+            self.load_image(meme_id, size, accept_webp=True)
+            for meme_id in meme_ids
+            for size in self.rendition_names()
+        ))
+    def image_cache_stats(self) -> dict[str, int] | None:
+        return self.image_cache.stats() if self.image_cache is not None else None
+    @core.metrics.traced("meme.vote")
+    async def vote_meme(self, meme_id: str, upvote: bool, clicked: bool, username: str) -> bool:
+        """
+        Casts (clicked) or withdraws (not clicked) a vote. The vote record changes in one
+        conditional write, and the counter moves only when that write applied a transition,
+        so concurrent requests can't push the two apart.
+        """
+        if self.vote_buffer is not None and not await self.db.memes.find_one({"meme_id": meme_id}, {"_id": 1}):
             return False
-        update = {"$inc": {"votes": 1 if upvote == clicked else -1}}
-
-        if clicked:
-            profile_update = {"$set": {f"voted_memes.{meme_id}": upvote}}
+        if self.config.votes.transactions and self.vote_buffer is None:
+            async with await self.db.client.start_session() as session:
+                try:
+                    # The callback may run more than once, so it only writes.
+                    delta, meme = await session.with_transaction(
+                        lambda session: self.write_vote(meme_id, upvote, clicked, username, session)
+                    )
+                except pymongo.errors.DuplicateKeyError:
+                    return False
         else:
-            profile_update = {"$unset": {f"voted_memes.{meme_id}": ""}}
-        
-        self.db["profiles"].update_one(
-            {"username": username},
-            profile_update,
-            upsert=True
+            delta, meme = await self.write_vote(meme_id, upvote, clicked, username)
+        return self.publish_vote(meme_id, delta, meme)
+    async def write_vote(self, meme_id: str, upvote: bool, clicked: bool, username: str, session=None) -> tuple[int, dict | None]:
+        """
+        Stores a vote and, unless votes are buffered, its counter change. Returns the change
+        (0 if nothing applied) and the updated meme.
+        """
+        delta = await self.transition_vote(meme_id, upvote, clicked, username, session)
+        if not delta or self.vote_buffer is not None:
+            # Buffered: the user's vote is stored above; only the counter is written behind.
+            return delta, None
+        meme = await self.db.memes.find_one_and_update(
+            {"meme_id": meme_id},
+            [
+                {"$set": {"votes": {"$add": ["$votes", delta]}}},
+                {"$set": {"hot": HOT_SCORE_EXPR}}
+            ],
+            projection=LEADERBOARD_PROJECTION,
+            return_document=pymongo.ReturnDocument.AFTER,
+            session=session
         )
-        result = self.db.memes.update_one({"meme_id": meme_id}, update)
-        return result.modified_count > 0
-    def list_memes(self, skip: int = 0, limit: int = 10, username: str | None = None) -> List[Dict]:
-        if limit > 25:
-            limit = 25
-        memes = []
-        voted_memes = {}
-        if username:
-            profile = self.db.profiles.find_one({"username": username})
-            if profile:
-                voted_memes = profile.get("voted_memes", {})
-        for i in list(self.db.memes.find({}, {"_id": 0}).skip(skip).limit(limit)):
-            memes.append({
-                "meme_id": i["meme_id"],
-                "title": i["title"],
-                "username": i["username"],
-                "votes": i["votes"],
-                "created_at": i["created_at"],
-                "user_vote": voted_memes.get(i["meme_id"], None)
-            })
-        return memes
-    def delete_meme(self, meme_id: str) -> bool:
-        result = self.db.memes.delete_one({"meme_id": meme_id})
-        return result.deleted_count > 0
+        if meme is None:
+            # No such meme, so the vote record must not outlive this request either.
+            await self.db.votes.delete_one({"username": username, "meme_id": meme_id}, session=session)
+            return 0, None
+        return delta, meme
+    def publish_vote(self, meme_id: str, delta: int, meme: dict | None) -> bool:
+        """
+        Passes a stored vote on to the buffer, leaderboard and event stream, once it is committed.
+        """
+        if not delta:
+            return False
+        if self.vote_buffer is not None:
+            self.vote_buffer.add(meme_id, delta)
+            self.leaderboard.adjust(meme_id, delta)
+        elif meme.get("status", "ready") == "ready":
+            self.leaderboard.update(meme)
+        if self.events is not None:
+            self.events.vote(meme_id, delta)
+        return True
+    @core.metrics.traced("meme.vote_many")
+    async def vote_memes(self, votes: list[tuple[str, bool, bool]], username: str) -> list[bool]:
+        """
+        Applies several of one user's (meme_id, upvote, clicked) votes. Each vote record still
+        moves with its own conditional write, since only those report whether a transition
+        applied, but they run concurrently and all the counter changes go out in one bulk write.
+        Returns whether each vote changed anything. Raises ValueError for more than BATCH_LIMIT
+        votes or a meme listed twice.
+        """
+        meme_ids = [meme_id for meme_id, _, _ in votes]
+        if len(votes) > BATCH_LIMIT:
+            raise ValueError(f"At most {BATCH_LIMIT} votes per batch")
+        if len(set(meme_ids)) != len(meme_ids):
+            raise ValueError("Each meme may be voted on once per batch")
+        if self.config.votes.transactions and self.vote_buffer is None:
+            return [await self.vote_meme(meme_id, upvote, clicked, username) for meme_id, upvote, clicked in votes]
+        existing = set(await self.db.memes.distinct("meme_id", {"meme_id": {"$in": meme_ids}}))
+        votes = [vote for vote in votes if vote[0] in existing]
+        deltas = await asyncio.gather(*[
+            self.transition_vote(meme_id, upvote, clicked, username)
+            for meme_id, upvote, clicked in votes
+        ])
+        applied = {vote[0]: delta for vote, delta in zip(votes, deltas) if delta}
+        if applied and self.vote_buffer is not None:
+            for meme_id, delta in applied.items():
+                self.vote_buffer.add(meme_id, delta)
+        elif applied:
+            result = await self.db.memes.bulk_write([
+                pymongo.UpdateOne(
+                    {"meme_id": meme_id},
+                    [
+                        {"$set": {"votes": {"$add": ["$votes", delta]}}},
+                        {"$set": {"hot": HOT_SCORE_EXPR}}
+                    ]
+                )
+                for meme_id, delta in applied.items()
+            ], ordered=False)
+            if result.matched_count < len(applied):
+                # Memes deleted since the existence check; their new vote records must go too.
+                remaining = set(await self.db.memes.distinct("meme_id", {"meme_id": {"$in": list(applied)}}))
+                missing = [meme_id for meme_id in applied if meme_id not in remaining]
+                await self.db.votes.delete_many({"username": username, "meme_id": {"$in": missing}})
+                for meme_id in missing:
+                    del applied[meme_id]
+        for meme_id, delta in applied.items():
+            self.leaderboard.adjust(meme_id, delta)
+            if self.events is not None:
+                self.events.vote(meme_id, delta)
+        return [meme_id in applied for meme_id in meme_ids]
+    async def transition_vote(self, meme_id: str, upvote: bool, clicked: bool, username: str, session=None) -> int:
+        """
+        Moves the user's vote record to its new state if it isn't there already.
+        Returns the resulting change to the meme's count, 0 when nothing changed.
+        """
+        voter = {"username": username, "meme_id": meme_id}
+        if not clicked:
+            removed = await self.db.votes.find_one_and_delete({**voter, "upvote": upvote}, session=session)
+            if removed is None:
+                return 0
+            return -1 if upvote else 1
+        try:
+            # Matches only a vote in the other direction; with no vote at all it inserts one.
+            prior = await self.db.votes.find_one_and_update(
+                {**voter, "upvote": {"$ne": upvote}},
+                {"$set": {"upvote": upvote, "voted_at": time.time()}},
+                projection={"_id": 0, "upvote": 1},
+                upsert=True,
+                return_document=pymongo.ReturnDocument.BEFORE,
+                session=session
+            )
+        except pymongo.errors.DuplicateKeyError:
+            # The unique (username, meme_id) index rejected the insert: the vote already points this way.
+            if session is not None:
+                # The error aborted the transaction; let vote_meme end it.
+                raise
+            return 0
+        step = 1 if upvote else -1
+        return step if prior is None else 2 * step
+    @core.metrics.traced("meme.list")
+    async def list_memes(
+            self,
+            sort: str = "new",
+            cursor: str | None = None,
+            limit: int = 10,
+            username: str | None = None
+        ) -> tuple[List[Dict], str | None]:
+        """
+        Returns a page of the feed and the cursor for the next page, or None on the last page.
+        Pages are keyed on (sort field, meme_id) so every page is an index range scan.
+        Raises ValueError for an unknown sort or a malformed cursor.
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Unknown sort: {sort}")
+        field = SORT_FIELDS[sort]
+        limit = max(1, min(limit, 25))
+        query = dict(FEED_QUERY)
+        if cursor:
+            sort_value, last_id = decode_cursor(cursor)
+            query[field] = {"$lte": sort_value}
+            query["$or"] = [{field: {"$lt": sort_value}}, {"meme_id": {"$lt": last_id}}]
+        projection = {**FEED_PROJECTION, field: 1}
+        page = await self.db.memes.find(query, projection).sort(
+            [(field, pymongo.DESCENDING), ("meme_id", pymongo.DESCENDING)]
+        ).limit(limit + 1).to_list(length=limit + 1)
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1][field], page[-1]["meme_id"])
+        voted_memes = await self.user_votes(username, [i["meme_id"] for i in page]) if username else {}
+        return [self.feed_item(i, voted_memes) for i in page], next_cursor
+    @core.metrics.traced("meme.get_many")
+    async def get_memes(self, meme_ids: list[str], username: str | None = None) -> list[dict]:
+        """
+        Returns the listed memes that exist and are ready, in the order given, with one query
+        (and one more for the user's votes). Raises ValueError for more than BATCH_LIMIT ids.
+        """
+        if len(meme_ids) > BATCH_LIMIT:
+            raise ValueError(f"At most {BATCH_LIMIT} memes per batch")
+        found = await self.db.memes.find(
+            {**FEED_QUERY, "meme_id": {"$in": meme_ids}},
+            FEED_PROJECTION
+        ).to_list(None)
+        by_id = {meme["meme_id"]: meme for meme in found}
+        voted_memes = await self.user_votes(username, list(by_id)) if username else {}
+        return [self.feed_item(by_id[meme_id], voted_memes) for meme_id in dict.fromkeys(meme_ids) if meme_id in by_id]
+    def feed_item(self, meme: dict, voted_memes: dict[str, bool]) -> dict:
+        return {
+            "meme_id": meme["meme_id"],
+            "title": meme["title"],
+            "username": meme["username"],
+            "votes": self.current_votes(meme["meme_id"], meme["votes"]),
+            "created_at": meme["created_at"],
+            "user_vote": voted_memes.get(meme["meme_id"], None)
+        }
+    def current_votes(self, meme_id: str, stored_votes: int) -> int:
+        """
+        Reads a vote count through the vote buffer, so buffered votes show up immediately.
+        """
+        if self.vote_buffer is None:
+            return stored_votes
+        return stored_votes + self.vote_buffer.pending(meme_id)
+    @core.metrics.traced("meme.user_votes")
+    async def user_votes(self, username: str, meme_ids: list[str]) -> dict[str, bool]:
+        """
+        Returns the user's vote direction on each of the given memes they voted on.
+        """
+        if not meme_ids:
+            return {}
+        votes = await self.db.votes.find(
+            {"username": username, "meme_id": {"$in": meme_ids}},
+            {"_id": 0, "meme_id": 1, "upvote": 1}
+        ).to_list(None)
+        return {vote["meme_id"]: vote["upvote"] for vote in votes}
+    @core.metrics.traced("meme.delete")
+    async def delete_meme(self, meme_id: str) -> bool:
+        meme = await self.db.memes.find_one_and_delete({"meme_id": meme_id}, {"image.key": 1, "blob_keys": 1})
+        if not meme:
+            return False
+        self.invalidate_images(meme_id)
+        self.leaderboard.remove(meme_id)
+        if self.events is not None:
+            self.events.delete(meme_id)
+        await self.db.votes.delete_many({"meme_id": meme_id})
+        keys = set(meme.get("blob_keys", []))
+        if "image" in meme:
+            keys.add(meme["image"]["key"])
+        for key in keys:
+            await self.release_image(key)
+        return True
+    @core.metrics.traced("meme.delete_many")
+    async def delete_memes(self, meme_ids: list[str]) -> list[str]:
+        """
+        Deletes the listed memes along with their votes and any blobs no remaining meme uses.
+        Returns the ids that existed. Raises ValueError for more than BATCH_LIMIT ids.
+        """
+        if len(meme_ids) > BATCH_LIMIT:
+            raise ValueError(f"At most {BATCH_LIMIT} memes per batch")
+        memes = await self.db.memes.find(
+            {"meme_id": {"$in": meme_ids}},
+            {"_id": 0, "meme_id": 1, "image.key": 1, "blob_keys": 1}
+        ).to_list(None)
+        if not memes:
+            return []
+        deleted = [meme["meme_id"] for meme in memes]
+        await self.db.memes.delete_many({"meme_id": {"$in": deleted}})
+        for meme_id in deleted:
+            self.invalidate_images(meme_id)
+            self.leaderboard.remove(meme_id)
+            if self.events is not None:
+                self.events.delete(meme_id)
+        await self.db.votes.delete_many({"meme_id": {"$in": deleted}})
+        keys = set()
+        for meme in memes:
+            keys.update(meme.get("blob_keys", []))
+            if "image" in meme:
+                keys.add(meme["image"]["key"])
+        await self.release_images(keys)
+        return deleted
+    async def release_images(self, keys: set[str]) -> None:
+        """
+        Deletes the blobs among keys that no meme references any more, checking them all in two queries.
+        """
+        if not keys:
+            return
+        referenced = set(await self.db.memes.distinct("image.key", {"image.key": {"$in": list(keys)}}))
+        referenced.update(await self.db.memes.distinct("blob_keys", {"blob_keys": {"$in": list(keys)}}))
+        for key in keys - referenced:
+            await self.delete_blob(key)
+    async def release_image(self, key: str) -> None:
+        if not await self.blob_referenced(key):
+            await self.delete_blob(key)
+    async def blob_referenced(self, key: str) -> bool:
+        return await self.db.memes.find_one({"$or": [{"image.key": key}, {"blob_keys": key}]}, {"_id": 1}) is not None
+    async def delete_blob(self, key: str) -> None:
+        """
+        Deletes an unreferenced blob, putting it back if a meme referenced it meanwhile.
+        With keep_blobs on the inserting side, whichever of the two runs last restores it.
+        """
+        data = await self.blob_store.get(key)
+        if data is None:
+            return
+        await self.blob_store.delete(key)
+        if await self.blob_referenced(key):
+            await self.blob_store.put(data)
+    async def keep_blobs(self, keys: list[str], blobs: dict[str, bytes]) -> bool:
+        """
+        Called once a meme referencing keys is stored: puts back from blobs any key a
+        concurrent delete_blob removed. Returns False if one is gone and not in blobs.
+        """
+        for key in keys:
+            if await self.blob_store.exists(key):
+                continue
+            if key not in blobs:
+                return False
+            await self.blob_store.put(blobs[key])
+        return True
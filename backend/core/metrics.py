@@ -0,0 +1,139 @@
+"""
+Instrumentation for MemeArena.
+Request, MongoDB and transcode timings go into Prometheus histograms; cache and queue
+stats are read from their owners only when /metrics is scraped. Sampled requests also
+collect timed spans from the functions marked with @traced and log them when they finish.
+"""
+
+import contextvars
+import functools
+import logging
+import time
+from typing import Callable
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+REQUEST_DURATION = Histogram(
+    "memearena_http_request_duration_seconds",
+    "Time spent serving HTTP requests",
+    ["method", "route"]
+)
+REQUESTS = Counter(
+    "memearena_http_requests",
+    "HTTP requests served",
+    ["method", "route", "status"]
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "memearena_http_requests_in_flight",
+    "HTTP requests currently being served",
+    multiprocess_mode="livesum"
+)
+MONGO_DURATION = Histogram(
+    "memearena_mongodb_command_duration_seconds",
+    "Time MongoDB commands took, as seen by the driver",
+    ["collection", "command"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+)
+MONGO_FAILURES = Counter(
+    "memearena_mongodb_command_failures",
+    "MongoDB commands that failed",
+    ["collection", "command"]
+)
+TRANSCODE_DURATION = Histogram(
+    "memearena_transcode_duration_seconds",
+    "Time spent transcoding an upload into its renditions, including queueing for the pool",
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+)
+TRANSCODE_REJECTED = Counter(
+    "memearena_transcode_rejected",
+    "Uploads turned away because the transcode queue was full"
+)
+
+current_trace: contextvars.ContextVar["Trace | None"] = contextvars.ContextVar("current_trace", default=None)
+
+class Trace:
+    """
+    Spans recorded while serving one sampled request.
+    """
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.spans: list[tuple[str, float, float]] = []
+    def add(self, name: str, start: float, end: float) -> None:
+        self.spans.append((name, start, end))
+    def log(self, method: str, route: str, status: int, elapsed: float) -> None:
+        spans = " ".join(
+            f"{name}@{(start - self.start) * 1000:.1f}ms={(end - start) * 1000:.1f}ms"
+            for name, start, end in sorted(self.spans, key=lambda span: span[1])
+        )
+        logger.info("trace %s %s %d %.1fms %s", method, route, status, elapsed * 1000, spans)
+
+def traced(name: str):
+    """
+    Records calls to an async function as spans on the current request's trace, if it is sampled.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            trace = current_trace.get()
+            if trace is None:
+                return await function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                trace.add(name, start, time.perf_counter())
+        return wrapper
+    return decorator
+
+class CommandTimer(monitoring.CommandListener):
+    """
+    Times every command the driver sends, labelled by collection and command name.
+    """
+    def __init__(self) -> None:
+        self.pending: dict[tuple[int, object], tuple[str, str]] = {}
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        self.pending[(event.request_id, event.connection_id)] = (
+            target if isinstance(target, str) else "",
+            event.command_name
+        )
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        labels = self.pending.pop((event.request_id, event.connection_id), None)
+        if labels is not None:
+            MONGO_DURATION.labels(*labels).observe(event.duration_micros / 1e6)
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        labels = self.pending.pop((event.request_id, event.connection_id), None)
+        if labels is not None:
+            MONGO_DURATION.labels(*labels).observe(event.duration_micros / 1e6)
+            MONGO_FAILURES.labels(*labels).inc()
+
+class StatsCollector:
+    """
+    Exposes cache counters and queue depths at scrape time. caches() returns each cache's
+    stats() (or None when disabled) by name; queues() returns each queue's depth by name.
+    """
+    def __init__(self, caches: Callable[[], dict[str, dict[str, int] | None]], queues: Callable[[], dict[str, int]]) -> None:
+        self.caches = caches
+        self.queues = queues
+    def collect(self):
+        hits = CounterMetricFamily("memearena_cache_hits", "Cache lookups that found an entry", labels=["cache"])
+        misses = CounterMetricFamily("memearena_cache_misses", "Cache lookups that found nothing", labels=["cache"])
+        entries = GaugeMetricFamily("memearena_cache_entries", "Entries currently cached", labels=["cache"])
+        for name, stats in self.caches().items():
+            if stats is None:
+                continue
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            entries.add_metric([name], stats["entries"])
+        depth = GaugeMetricFamily("memearena_queue_depth", "Work items running or waiting in a pool", labels=["queue"])
+        for name, value in self.queues().items():
+            depth.add_metric([name], value)
+        yield hits
+        yield misses
+        yield entries
+        yield depth
@@ -0,0 +1,156 @@
+"""
+ASGI middleware for MemeArena.
+Written as plain ASGI callables rather than BaseHTTPMiddleware so response
+bodies (including memoryview image bodies) pass through untouched.
+"""
+
+import core.metrics
+import core.ratelimit
+import schemas.common
+import math
+import random
+import time
+from typing import Callable
+from fastapi.responses import JSONResponse
+
+class UploadTooLarge(Exception):
+    """
+    Raised from receive() once an upload body passes the limit.
+    """
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects uploads whose Content-Length exceeds the limit before the multipart body is
+    parsed. Bodies without one (chunked) are counted as they arrive and cut off as soon
+    as they pass the limit.
+    """
+    def __init__(self, app, path: str, max_bytes: int) -> None:
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+    async def reject(self, scope, receive, send) -> None:
+        response = JSONResponse(schemas.common.ResponseModel(
+            success=False,
+            code=413
+        ).model_dump())
+        await response(scope, receive, send)
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                await self.reject(scope, receive, send)
+                return
+        received = 0
+        exceeded = False
+        started = False
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise UploadTooLarge()
+            return message
+        async def guarded_send(message) -> None:
+            nonlocal started
+            # The form parser turns the abort into its own error response; drop it.
+            if exceeded:
+                return
+            started = True
+            await send(message)
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            pass
+        if exceeded and not started:
+            await self.reject(scope, receive, send)
+
+class MetricsMiddleware:
+    """
+    Records latency, status and in-flight counts per route template, and traces a sample of requests.
+    """
+    def __init__(self, app, trace_sample_rate: float = 0.0) -> None:
+        self.app = app
+        self.trace_sample_rate = trace_sample_rate
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        trace = None
+        if self.trace_sample_rate and random.random() < self.trace_sample_rate:
+            trace = core.metrics.Trace()
+            token = core.metrics.current_trace.set(trace)
+        core.metrics.REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            core.metrics.REQUESTS_IN_FLIGHT.dec()
+            # The router leaves the matched route in the scope; unmatched paths share one label.
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            core.metrics.REQUEST_DURATION.labels(scope["method"], route_path).observe(elapsed)
+            core.metrics.REQUESTS.labels(scope["method"], route_path, str(status)).inc()
+            if trace is not None:
+                core.metrics.current_trace.reset(token)
+                trace.log(scope["method"], route_path, status, elapsed)
+
+class RateLimitMiddleware:
+    """
+    Answers 429 with Retry-After once a client's bucket for the route is empty, before the
+    route does any work. Clients are identified by a token the auth caches already know,
+    otherwise by IP address.
+    """
+    def __init__(
+            self,
+            app,
+            limiter: core.ratelimit.RateLimiter,
+            identify: Callable[[str], str | None],
+            trusted_hops: int = 0
+        ) -> None:
+        self.app = app
+        self.limiter = limiter
+        self.identify = identify
+        self.trusted_hops = trusted_hops
+    def client(self, scope) -> str:
+        address = scope["client"][0] if scope.get("client") else "unknown"
+        forwarded = []
+        for name, value in scope["headers"]:
+            if name == b"authorization" and value.startswith(b"Bearer "):
+                username = self.identify(value[7:].decode("latin-1"))
+                if username:
+                    return f"user:{username}"
+            elif name == b"x-forwarded-for" and self.trusted_hops:
+                # Repeated headers form one list, in order.
+                forwarded.extend(entry.strip() for entry in value.decode("latin-1").split(","))
+        # Entries left of what the trusted proxies appended are whatever the client sent.
+        if self.trusted_hops and len(forwarded) >= self.trusted_hops:
+            address = forwarded[-self.trusted_hops]
+        return f"ip:{address}"
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http":
+            rule = self.limiter.match(scope["method"], scope["path"])
+            if rule is not None:
+                retry_after = await self.limiter.check(rule, self.client(scope))
+                if retry_after > 0:
+                    response = JSONResponse(
+                        schemas.common.ResponseModel(
+                            success=False,
+                            code=429
+                        ).model_dump(),
+                        status_code=429,
+                        headers={"Retry-After": str(math.ceil(retry_after))}
+                    )
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
@@ -0,0 +1,81 @@
+"""
+Password hashing for MemeArena.
+Hashes are computed with a configurable KDF on a small dedicated thread pool, so a
+burst of logins queues there instead of stalling the event loop or other routes.
+"""
+
+import core.config
+import asyncio
+import hashlib
+import hmac
+import re
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+from passlib.exc import MissingBackendError
+
+SCHEMES = ("bcrypt", "argon2", "scrypt")
+# Unsalted hex SHA-256, as stored before KDF hashing.
+LEGACY_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+class HasherBusy(Exception):
+    """
+    Raised when the hashing queue is full.
+    """
+
+class PasswordHasher:
+    def __init__(self, config: core.config.Auth) -> None:
+        if config.password_scheme not in SCHEMES:
+            raise ValueError(f"Unknown password scheme: {config.password_scheme}")
+        self.config = config
+        # Every scheme stays verifiable; hashes not using the configured scheme and costs
+        # are flagged for rehashing on the next successful login.
+        self.context = CryptContext(
+            schemes=[config.password_scheme] + [scheme for scheme in SCHEMES if scheme != config.password_scheme],
+            deprecated="auto",
+            bcrypt__rounds=config.bcrypt_rounds,
+            argon2__time_cost=config.argon2_time_cost,
+            argon2__memory_cost=config.argon2_memory_cost,
+            argon2__parallelism=config.argon2_parallelism,
+            scrypt__rounds=config.scrypt_rounds
+        )
+        # Fail at startup rather than on every register and login.
+        try:
+            self.context.handler(config.password_scheme).get_backend()
+        except MissingBackendError as e:
+            raise ValueError(f"No backend installed for password scheme: {config.password_scheme}") from e
+        self.executor: ThreadPoolExecutor | None = None
+        self.pending = 0
+    @property
+    def capacity(self) -> int:
+        return self.config.hash_workers + self.config.hash_queue_depth
+    def get_executor(self) -> ThreadPoolExecutor:
+        # The KDF backends release the GIL while hashing, so threads run them in parallel.
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.config.hash_workers,
+                thread_name_prefix="password-hash"
+            )
+        return self.executor
+    async def run(self, function, *args):
+        if self.pending >= self.capacity:
+            raise HasherBusy()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.get_executor(), function, *args)
+        finally:
+            self.pending -= 1
+    async def hash(self, password: str) -> str:
+        return await self.run(self.context.hash, password)
+    async def verify(self, password: str, stored_hash: str) -> tuple[bool, str | None]:
+        """
+        Checks a password. Returns (valid, new_hash), where new_hash is set when the stored
+        hash is legacy SHA-256 or uses outdated settings and should be replaced.
+        """
+        if LEGACY_SHA256.fullmatch(stored_hash):
+            valid = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored_hash)
+            return valid, await self.hash(password) if valid else None
+        return await self.run(self.context.verify_and_update, password, stored_hash)
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
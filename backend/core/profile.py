@@ -1,30 +1,30 @@
-import core.database
 import core.config
+import core.metrics
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 
 class ProfileManager:
-    def __init__(self, config: core.config.Config) -> None:
-        self.db = core.database.factory(
-            config.mongodb.uri,
-            config.mongodb.db
-        )
-    def create_profile(
+    def __init__(self, config: core.config.Config, db: AsyncIOMotorDatabase) -> None:
+        self.db = db
+    async def create_profile(
             self,
             username: str,
             email: str,
         ) -> bool:
-        if self.db.profiles.find_one({"username": username}):
+        try:
+            await self.db.profiles.insert_one({
+                "username": username,
+                "email": email
+            })
+        except DuplicateKeyError:
             return False
-        self.db.profiles.insert_one({
-            "username": username,
-            "email": email,
-            "voted_memes": {}
-        })
         return True
-    def get_profile(self, username: str) -> dict | None:
-        return self.db.profiles.find_one({"username": username}, {"_id": 0})
+    @core.metrics.traced("profile.get")
+    async def get_profile(self, username: str) -> dict | None:
+        return await self.db.profiles.find_one({"username": username}, {"_id": 0, "voted_memes": 0})
 
-    def update_profile(self, username: str, profile_data: dict) -> bool:
-        result = self.db.profiles.update_one(
+    async def update_profile(self, username: str, profile_data: dict) -> bool:
+        result = await self.db.profiles.update_one(
             {"username": username},
             {"$set": profile_data},
             upsert=True
@@ -0,0 +1,111 @@
+"""
+Token-bucket rate limiting for MemeArena.
+Each configured rule gives every client (a user, or an IP address when the request
+carries no known token) a bucket of burst tokens refilling at rate per second. Buckets
+live in this process's memory or, to be shared between workers, in Mongo.
+"""
+
+import core.config
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from starlette.routing import compile_path
+
+logger = logging.getLogger(__name__)
+
+class Rule:
+    def __init__(self, method: str, path: str, rate: float, burst: int) -> None:
+        self.method = method.upper()
+        self.path = path
+        self.pattern = compile_path(path)[0]
+        self.rate = rate
+        self.burst = burst
+    def matches(self, method: str, path: str) -> bool:
+        return method == self.method and self.pattern.match(path) is not None
+
+class MemoryBuckets:
+    """
+    Buckets in this process only; with several workers each enforces its own share.
+    """
+    def __init__(self, config: core.config.Config, db: AsyncIOMotorDatabase | None) -> None:
+        self.max_keys = config.rate_limit.max_keys
+        # key -> (tokens, updated_at)
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        allowed = tokens >= 1
+        self.buckets[key] = (tokens - 1 if allowed else tokens, now)
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return 0.0 if allowed else (1 - tokens) / rate
+
+class MongoBuckets:
+    """
+    Buckets in the rate_limits collection, refilled and drawn from in one atomic update
+    so every worker sees the same count. Idle buckets expire once they would be full again.
+    """
+    def __init__(self, config: core.config.Config, db: AsyncIOMotorDatabase | None) -> None:
+        if db is None:
+            raise ValueError("The mongo rate limit backend needs a database")
+        self.db = db
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.time()
+        refilled = {"$min": [burst, {"$add": [
+            {"$ifNull": ["$tokens", burst]},
+            {"$multiply": [{"$max": [0, {"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}]}, rate]}
+        ]}]}
+        bucket = await self.db.rate_limits.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=burst / rate)
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return 0.0 if bucket["allowed"] else (1 - bucket["tokens"]) / rate
+
+BACKENDS = {
+    "memory": MemoryBuckets,
+    "mongo": MongoBuckets
+}
+
+class RateLimiter:
+    def __init__(self, config: core.config.Config) -> None:
+        if config.rate_limit.backend not in BACKENDS:
+            raise ValueError(f"Unknown rate limit backend: {config.rate_limit.backend}")
+        self.config = config
+        self.rules = [Rule(*rule) for rule in config.rate_limit.rules]
+        self.buckets = None
+    def bind(self, db: AsyncIOMotorDatabase | None) -> None:
+        """
+        Creates the bucket store; the mongo backend needs the app's database.
+        """
+        self.buckets = BACKENDS[self.config.rate_limit.backend](self.config, db)
+    def match(self, method: str, path: str) -> Rule | None:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+    async def check(self, rule: Rule, client: str) -> float:
+        """
+        Takes a token for client under rule. Returns 0 if the request may proceed, otherwise
+        the seconds until it could. Fails open if the shared store is unreachable.
+        """
+        if self.buckets is None:
+            return 0.0
+        try:
+            return await self.buckets.take(f"{rule.method} {rule.path} {client}", rule.rate, rule.burst)
+        except PyMongoError:
+            logger.warning("Rate limit store unavailable, letting request through", exc_info=True)
+            return 0.0
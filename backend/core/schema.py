@@ -0,0 +1,152 @@
+"""
+Index bootstrap and query-plan checks for MemeArena's collections.
+"""
+
+import core.config
+import core.dedup
+import core.leaderboard
+import core.meme
+import logging
+import time
+from datetime import datetime, timezone
+import pymongo
+from pymongo import ASCENDING, DESCENDING
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+# collection -> [(keys, options)]
+INDEXES = {
+    "memes": [
+        ([("meme_id", ASCENDING)], {"unique": True}),
+        ([("created_at", DESCENDING), ("meme_id", DESCENDING)], {"name": "feed_new"}),
+        ([("votes", DESCENDING), ("meme_id", DESCENDING)], {"name": "feed_top"}),
+        ([("hot", DESCENDING), ("meme_id", DESCENDING)], {"name": "feed_hot"}),
+        ([("image.key", ASCENDING)], {}),
+        ([("blob_keys", ASCENDING)], {}),
+        ([("phash_bands", ASCENDING)], {"sparse": True})
+    ],
+    "user_credentials": [
+        ([("username", ASCENDING)], {"unique": True})
+    ],
+    "profiles": [
+        ([("username", ASCENDING)], {"unique": True})
+    ],
+    "auth_tokens": [
+        ([("token", ASCENDING)], {"unique": True}),
+        ([("username", ASCENDING)], {})
+    ],
+    "votes": [
+        ([("username", ASCENDING), ("meme_id", ASCENDING)], {"unique": True}),
+        ([("meme_id", ASCENDING)], {})
+    ],
+    "jobs": [
+        ([("job_id", ASCENDING)], {"unique": True}),
+        ([("status", ASCENDING), ("available_at", ASCENDING)], {}),
+        ([("status", ASCENDING), ("lease_until", ASCENDING)], {}),
+        ([("meme_id", ASCENDING), ("created_at", DESCENDING)], {}),
+        ([("raw_key", ASCENDING), ("status", ASCENDING)], {})
+    ],
+    "rate_limits": [
+        ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0})
+    ]
+}
+
+def ttl_indexes(config: core.config.Config) -> dict[str, tuple[list, dict]]:
+    """
+    Lets Mongo expire sessions, and revocations of sessions, once the session TTL has passed,
+    and stream batches once every worker has long since read them.
+    """
+    return {
+        "auth_tokens": ([("created_at", ASCENDING)], {"name": "session_ttl", "expireAfterSeconds": config.auth.session_ttl}),
+        "revocations": ([("revoked_at", ASCENDING)], {"name": "session_ttl", "expireAfterSeconds": config.auth.session_ttl}),
+        "stream_events": ([("created_at", ASCENDING)], {"name": "stream_retention", "expireAfterSeconds": config.stream.retention})
+    }
+
+def manager_queries() -> list[tuple[str, str, dict, list | None]]:
+    """
+    Representative filters and sorts for every query the managers run, as (label, collection, filter, sort).
+    """
+    now = time.time()
+    return [
+        ("meme by id", "memes", {"meme_id": "x"}, None),
+        ("duplicate probe", "memes", {"phash_bands": {"$in": [0, 1]}, **core.dedup.CANDIDATE_QUERY}, None),
+        *[
+            (f"{sort} feed page", "memes", {
+                **core.meme.FEED_QUERY,
+                field: {"$lte": 0},
+                "$or": [{field: {"$lt": 0}}, {"meme_id": {"$lt": "x"}}]
+            }, [(field, DESCENDING), ("meme_id", DESCENDING)])
+            for sort, field in core.meme.SORT_FIELDS.items()
+        ],
+        *[
+            (f"{window} leaderboard", "memes", {
+                **core.meme.FEED_QUERY,
+                **({"created_at": {"$gte": 0}} if seconds else {})
+            }, [("votes", DESCENDING), ("meme_id", DESCENDING)])
+            for window, seconds in core.leaderboard.WINDOWS.items()
+        ],
+        ("blob references", "memes", {"$or": [{"image.key": "x"}, {"blob_keys": "x"}]}, None),
+        ("credentials by username", "user_credentials", {"username": "x"}, None),
+        ("profile by username", "profiles", {"username": "x"}, None),
+        ("vote by user and meme", "votes", {"username": "x", "meme_id": "x"}, None),
+        ("votes on a page", "votes", {"username": "x", "meme_id": {"$in": ["x", "y"]}}, None),
+        ("votes by meme", "votes", {"meme_id": "x"}, None),
+        ("session by token", "auth_tokens", {"token": "x"}, None),
+        ("sessions by username", "auth_tokens", {"username": "x"}, None),
+        ("revocations since", "revocations", {"revoked_at": {"$gte": datetime.fromtimestamp(0, timezone.utc)}}, [("revoked_at", ASCENDING)]),
+        ("job by id", "jobs", {"job_id": "x"}, None),
+        ("claimable jobs", "jobs", {"$or": [
+            {"status": "queued", "available_at": {"$lte": now}},
+            {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$lt": 3}}
+        ]}, [("created_at", ASCENDING)]),
+        ("stalled jobs", "jobs", {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$gte": 3}}, None),
+        ("jobs by meme", "jobs", {"meme_id": "x"}, [("created_at", DESCENDING)]),
+        ("jobs by raw key", "jobs", {"raw_key": "x", "status": {"$in": ["queued", "running"]}}, None),
+        ("queue depth", "jobs", {"status": {"$in": ["queued", "running"]}}, None)
+    ]
+
+async def ensure_indexes(db: AsyncIOMotorDatabase, config: core.config.Config) -> None:
+    """
+    Creates every index the managers rely on. Safe to run on each startup.
+    """
+    for collection, indexes in INDEXES.items():
+        await db[collection].create_indexes([
+            pymongo.IndexModel(keys, **options) for keys, options in indexes
+        ])
+    for collection, (keys, options) in ttl_indexes(config).items():
+        existing = (await db[collection].index_information()).get(options["name"])
+        if existing and existing.get("expireAfterSeconds") != options["expireAfterSeconds"]:
+            # session_ttl changed since the index was built; update it in place.
+            await db.command("collMod", collection, index={
+                "name": options["name"],
+                "expireAfterSeconds": options["expireAfterSeconds"]
+            })
+        elif not existing:
+            await db[collection].create_index(keys, **options)
+
+def plan_stages(plan: dict):
+    yield plan.get("stage")
+    if "inputStage" in plan:
+        yield from plan_stages(plan["inputStage"])
+    for stage in plan.get("inputStages", []):
+        yield from plan_stages(stage)
+    for shard in plan.get("shards", []):
+        yield from plan_stages(shard.get("winningPlan", {}))
+
+async def check_indexes(db: AsyncIOMotorDatabase) -> list[str]:
+    """
+    Explains every manager query and returns the labels of those that fall back to a collection scan.
+    """
+    scans = []
+    for label, collection, query, sort in manager_queries():
+        cursor = db[collection].find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+        stages = set(plan_stages(winning_plan.get("queryPlan", winning_plan)))
+        if "COLLSCAN" in stages:
+            logger.warning("%s on %s is a collection scan", label, collection)
+            scans.append(label)
+    return scans
@@ -0,0 +1,82 @@
+"""
+HTTP serving helpers for stored blobs.
+Handles strong ETags, conditional requests and single byte ranges over memoryviews.
+"""
+
+from fastapi import Response
+
+class BlobResponse(Response):
+    """
+    Response whose body is a memoryview, handed to the server without copying.
+    """
+    def render(self, content) -> memoryview | bytes:
+        if content is None:
+            return b""
+        return content
+
+def make_etag(key: str) -> str:
+    return f'"{key}"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+def parse_range(range_header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Parses a single "bytes=" range into an inclusive (start, end) pair.
+    Returns None when the header is absent or not a single byte range, and
+    raises ValueError when the range cannot be satisfied.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+    start_text, end_text = (part.strip() for part in spec.split("-", 1))
+    if not (start_text or end_text).isdigit() or (end_text and not end_text.isdigit()):
+        return None
+    if not start_text:
+        suffix = int(end_text)
+        if suffix == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - suffix, 0), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+def blob_response(
+        view: memoryview,
+        key: str,
+        media_type: str,
+        if_none_match: str | None = None,
+        range_header: str | None = None,
+        if_range: str | None = None,
+        headers: dict[str, str] | None = None
+    ) -> Response:
+    etag = make_etag(key)
+    headers = {
+        **(headers or {}),
+        "ETag": etag,
+        "Accept-Ranges": "bytes"
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    size = len(view)
+    if if_range and if_range.strip() != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+    if byte_range is None:
+        return BlobResponse(view, media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return BlobResponse(view[start:end + 1], status_code=206, media_type=media_type, headers=headers)
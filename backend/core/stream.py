@@ -0,0 +1,190 @@
+"""
+Live event stream for MemeArena.
+Vote deltas, new memes and deletions are coalesced per tick into one batch, which a
+broker fans out to every worker. Each worker encodes a batch once and hands it to its
+connected clients through bounded per-client queues.
+"""
+
+import core.config
+import core.leaderboard
+import asyncio
+import logging
+import orjson
+from datetime import datetime, timezone
+from typing import Callable
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+RESYNC = b"event: resync\ndata: {}\n\n"
+KEEPALIVE = b": keepalive\n\n"
+
+def encode_batch(batch: dict) -> bytes:
+    return b"event: batch\ndata: " + orjson.dumps(batch) + b"\n\n"
+
+class MemoryBroker:
+    """
+    Delivers batches to this process only. Fine for a single worker.
+    """
+    def __init__(self, config: core.config.Config, db: AsyncIOMotorDatabase) -> None:
+        self.handler: Callable[[dict], None] | None = None
+    async def publish(self, batch: dict) -> None:
+        if self.handler is not None:
+            self.handler(batch)
+    async def listen(self, handler: Callable[[dict], None], stop: asyncio.Event) -> None:
+        self.handler = handler
+        await stop.wait()
+
+class MongoBroker:
+    """
+    Shares batches between workers through the stream_events collection, which every
+    worker (its own publishes included) follows with a change stream. Needs a replica set.
+    """
+    def __init__(self, config: core.config.Config, db: AsyncIOMotorDatabase) -> None:
+        self.db = db
+    async def publish(self, batch: dict) -> None:
+        await self.db.stream_events.insert_one({**batch, "created_at": datetime.now(timezone.utc)})
+    async def listen(self, handler: Callable[[dict], None], stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            try:
+                async with self.db.stream_events.watch(
+                    [{"$match": {"operationType": "insert"}}],
+                    max_await_time_ms=1000
+                ) as changes:
+                    while not stop.is_set():
+                        change = await changes.try_next()
+                        if change is None:
+                            continue
+                        batch = change["fullDocument"]
+                        del batch["_id"], batch["created_at"]
+                        handler(batch)
+            except PyMongoError:
+                logger.exception("Stream change feed failed, reopening")
+                try:
+                    await asyncio.wait_for(stop.wait(), 1)
+                except asyncio.TimeoutError:
+                    pass
+
+BROKERS = {
+    "memory": MemoryBroker,
+    "mongo": MongoBroker
+}
+
+class Subscriber:
+    """
+    One connected client. A client that falls a full queue behind has its backlog dropped
+    and is told to resync, so a slow reader never holds memory or delays the others.
+    """
+    def __init__(self, max_queue: int) -> None:
+        self.queue: asyncio.Queue[bytes | None] = asyncio.Queue(max_queue)
+    def deliver(self, message: bytes | None) -> None:
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC if message is not None else None)
+
+class EventHub:
+    """
+    on_deleted is called for every meme deleted on any worker, so per-process caches can drop it.
+    """
+    def __init__(
+            self,
+            config: core.config.Config,
+            db: AsyncIOMotorDatabase,
+            on_deleted: Callable[[str], None] | None = None
+        ) -> None:
+        if config.stream.broker not in BROKERS:
+            raise ValueError(f"Unknown stream broker: {config.stream.broker}")
+        self.config = config
+        self.broker = BROKERS[config.stream.broker](config, db)
+        self.votes: dict[str, int] = {}
+        self.added: list[dict] = []
+        self.deleted: list[str] = []
+        self.subscribers: set[Subscriber] = set()
+        self.on_deleted = on_deleted
+        self.closed = False
+    def vote(self, meme_id: str, delta: int) -> None:
+        self.votes[meme_id] = self.votes.get(meme_id, 0) + delta
+    def add(self, meme: dict) -> None:
+        self.added.append(core.leaderboard.summary(meme))
+    def delete(self, meme_id: str) -> None:
+        self.votes.pop(meme_id, None)
+        self.added = [meme for meme in self.added if meme["meme_id"] != meme_id]
+        self.deleted.append(meme_id)
+    def take(self) -> dict | None:
+        """
+        Returns everything recorded since the last call as one batch, or None if nothing changed.
+        """
+        votes = {meme_id: delta for meme_id, delta in self.votes.items() if delta}
+        if not votes and not self.added and not self.deleted:
+            self.votes = {}
+            return None
+        batch = {"votes": votes, "new": self.added, "deleted": self.deleted}
+        self.votes, self.added, self.deleted = {}, [], []
+        return batch
+    async def flush(self) -> None:
+        batch = self.take()
+        if batch is None:
+            return
+        try:
+            await self.broker.publish(batch)
+        except PyMongoError:
+            logger.exception("Dropped a stream batch")
+    def dispatch(self, batch: dict) -> None:
+        if self.on_deleted is not None:
+            for meme_id in batch.get("deleted", []):
+                self.on_deleted(meme_id)
+        message = encode_batch(batch)
+        for subscriber in self.subscribers:
+            subscriber.deliver(message)
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.config.stream.client_queue)
+        self.subscribers.add(subscriber)
+        return subscriber
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.discard(subscriber)
+    def close(self) -> None:
+        """
+        Ends every open stream; clients reconnect to another worker.
+        """
+        self.closed = True
+        for subscriber in self.subscribers:
+            subscriber.deliver(None)
+    async def stream(self):
+        """
+        Yields one client's server-sent events until it disconnects or the hub closes.
+        """
+        if self.closed:
+            return
+        subscriber = self.subscribe()
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), self.config.stream.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+    async def run(self, stop: asyncio.Event) -> None:
+        """
+        Publishes a batch every tick_ms and delivers incoming batches until stop is set.
+        """
+        listener = asyncio.create_task(self.broker.listen(self.dispatch, stop))
+        try:
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), self.config.stream.tick_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
+                await self.flush()
+        finally:
+            await listener
+            self.close()
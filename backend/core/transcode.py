@@ -0,0 +1,243 @@
+"""
+Image transcoding engine for MemeArena.
+Fits uploads into a fixed canvas, pads them and encodes every rendition in
+memory on a bounded process pool, falling back to ffmpeg for formats Pillow
+cannot read.
+"""
+
+import core.config
+import core.dedup
+import core.metrics
+import asyncio
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+class TranscoderBusy(Exception):
+    pass
+
+class TranscodeError(Exception):
+    pass
+
+def pad_to(image: Image.Image, width: int, height: int) -> Image.Image:
+    image = ImageOps.contain(image, (width, height), Image.Resampling.LANCZOS)
+    if image.size == (width, height):
+        return image
+    canvas = Image.new("RGB", (width, height))
+    canvas.paste(image, ((width - image.width) // 2, (height - image.height) // 2))
+    return canvas
+
+def encode(image: Image.Image, image_format: str, quality: int) -> bytes:
+    output = io.BytesIO()
+    if image_format == "jpeg":
+        image.save(output, "JPEG", quality=quality, optimize=True)
+    else:
+        image.save(output, "WEBP", quality=quality, method=4)
+    return output.getvalue()
+
+def render_renditions(
+        source: bytes | str,
+        sizes: list[tuple[str, int, int]],
+        quality: int,
+        webp_quality: int | None
+    ) -> dict[str, dict[str, bytes]]:
+    """
+    Decodes an image once and encodes it at every (name, width, height) in sizes,
+    each scaled to fit and padded onto a black canvas. The first size is the
+    largest and the others are scaled down from it. Returns
+    {name: {"jpeg": ..., "webp": ...}}, with WebP only when webp_quality is set.
+    source is the encoded image or a path to it. Runs inside pool workers, so it
+    must stay a picklable module-level function.
+    """
+    _, width, height = sizes[0]
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as image:
+        image.draft("RGB", (width, height))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        base = pad_to(image, width, height)
+    renditions = {}
+    for name, rendition_width, rendition_height in sizes:
+        rendition = base if (rendition_width, rendition_height) == base.size else pad_to(base, rendition_width, rendition_height)
+        renditions[name] = {"jpeg": encode(rendition, "jpeg", quality)}
+        if webp_quality is not None:
+            renditions[name]["webp"] = encode(rendition, "webp", webp_quality)
+    return renditions
+
+class FFmpegTranscoder:
+    def __init__(self, config: core.config.Transcode) -> None:
+        self.config = config
+    async def transcode(self, source: bytes | str) -> bytes:
+        width, height = self.config.width, self.config.height
+        if isinstance(source, str):
+            temp_input_path = None
+            input_path = source
+        else:
+            with tempfile.NamedTemporaryFile(delete=False) as temp_input:
+                temp_input.write(source)
+                temp_input_path = input_path = temp_input.name
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-i", input_path,
+                "-vf", f"scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2",
+                "-frames:v", "1",
+                "-q:v", "2",
+                "-f", "mjpeg",
+                "pipe:1",
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), self.config.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise
+            if process.returncode != 0:
+                raise TranscodeError(f"FFmpeg conversion failed: {stderr.decode(errors='replace')}")
+            return stdout
+        finally:
+            if temp_input_path:
+                os.unlink(temp_input_path)
+
+def ping() -> int:
+    return os.getpid()
+
+class TranscodeEngine:
+    def __init__(self, config: core.config.Transcode) -> None:
+        self.config = config
+        self.executor: ProcessPoolExecutor | None = None
+        self.ffmpeg = FFmpegTranscoder(config)
+        self.pending = 0
+    def capacity(self) -> int:
+        return self.config.workers + self.config.queue_depth
+    def check(self) -> bool:
+        """
+        Replaces the pool if one of its workers died (an OOM kill, say), which leaves a
+        ProcessPoolExecutor failing every call. Returns False if it had to.
+        """
+        # The executor only exposes this state privately.
+        if self.executor is not None and getattr(self.executor, "_broken", False):
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            return False
+        return True
+    def get_executor(self) -> ProcessPoolExecutor:
+        self.check()
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.config.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+    async def warm(self) -> None:
+        """
+        Starts every pool worker now, so the first uploads don't wait for processes to spawn.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+        await asyncio.gather(*(loop.run_in_executor(executor, ping) for _ in range(self.config.workers)))
+    def hold(self, future: Future) -> None:
+        """
+        Keeps a queue slot taken until the pool finishes a call its caller stopped waiting for.
+        """
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.release))
+    def release(self) -> None:
+        self.pending -= 1
+    async def run(self, function: Callable, *args: Any) -> Any:
+        """
+        Runs function in the pool within the configured timeout. A pool broken by a dead
+        worker is replaced and the call retried once; a second crash blames the input.
+        """
+        for _ in range(2):
+            future = None
+            try:
+                future = self.get_executor().submit(function, *args)
+                return await asyncio.wait_for(asyncio.wrap_future(future), self.config.timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                # The worker keeps running the call, so its slot isn't free yet.
+                if future is not None:
+                    self.hold(future)
+                raise
+            except BrokenProcessPool:
+                self.check()
+        raise TranscodeError("Transcode worker crashed")
+    def sizes(self) -> list[tuple[str, int, int]]:
+        return [("full", self.config.width, self.config.height)] + [
+            (name, width, height) for name, width, height in self.config.renditions
+        ]
+    async def render(self, source: bytes | str) -> dict[str, dict[str, bytes]]:
+        return await self.run(
+            render_renditions,
+            source,
+            self.sizes(),
+            self.config.quality,
+            self.config.webp_quality if self.config.webp else None
+        )
+    @core.metrics.traced("transcode")
+    async def transcode(self, source: bytes | str) -> dict[str, dict[str, bytes]]:
+        """
+        Transcodes an upload, given as bytes or a file path, into every configured
+        rendition. Raises TranscoderBusy when the pool and its queue are full, and
+        TranscodeError when decoding fails.
+        """
+        if self.pending >= self.capacity():
+            core.metrics.TRANSCODE_REJECTED.inc()
+            raise TranscoderBusy("Transcode queue is full")
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            if self.config.backend == "ffmpeg":
+                return await self.transcode_ffmpeg(source)
+            try:
+                return await self.render(source)
+            except asyncio.TimeoutError:
+                raise
+            except (UnidentifiedImageError, OSError) as e:
+                if not self.config.ffmpeg_fallback:
+                    raise TranscodeError(f"Unable to decode image: {e}") from e
+                return await self.transcode_ffmpeg(source)
+        finally:
+            self.pending -= 1
+            core.metrics.TRANSCODE_DURATION.observe(time.perf_counter() - start)
+    @core.metrics.traced("fingerprint")
+    async def fingerprint(self, source: bytes | str) -> int | None:
+        """
+        Perceptual hash of an upload, or None when Pillow can't decode it. Raises
+        TranscoderBusy when the pool and its queue are full.
+        """
+        if self.pending >= self.capacity():
+            core.metrics.TRANSCODE_REJECTED.inc()
+            raise TranscoderBusy("Transcode queue is full")
+        self.pending += 1
+        try:
+            return await self.run(
+                core.dedup.dhash,
+                source,
+                self.config.width,
+                self.config.height
+            )
+        except (UnidentifiedImageError, OSError):
+            return None
+        finally:
+            self.pending -= 1
+    async def transcode_ffmpeg(self, source: bytes | str) -> dict[str, dict[str, bytes]]:
+        """
+        Has ffmpeg produce the full JPEG, then derives the other renditions from it in the pool.
+        """
+        full = await self.ffmpeg.transcode(source)
+        renditions = await self.render(full)
+        renditions["full"]["jpeg"] = full
+        return renditions
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
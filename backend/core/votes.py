@@ -0,0 +1,104 @@
+"""
+Write-behind vote counting for MemeArena.
+Vote count changes are coalesced per meme in memory and flushed to Mongo in one
+bulk write, so a popular meme takes one update per flush instead of one per click.
+"""
+
+import core.config
+import core.meme
+import asyncio
+import logging
+import pymongo
+import pymongo.errors
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+# Per-write error codes worth retrying: write conflicts and a primary stepping down or
+# shutting down mid-batch. Anything else would fail again, so its delta is dropped.
+TRANSIENT_WRITE_ERRORS = {6, 7, 89, 91, 112, 189, 9001, 10107, 11600, 11602, 13435, 13436}
+
+class VoteBuffer:
+    def __init__(self, config: core.config.Config, db: AsyncIOMotorDatabase) -> None:
+        self.config = config
+        self.db = db
+        self.deltas: dict[str, int] = {}
+        # Deltas taken by a flush whose write hasn't returned yet.
+        self.inflight: dict[str, int] = {}
+        self.events = 0
+        self.wake = asyncio.Event()
+    def add(self, meme_id: str, delta: int) -> None:
+        self.deltas[meme_id] = self.deltas.get(meme_id, 0) + delta
+        self.events += 1
+        if self.events >= self.config.votes.flush_max_events:
+            self.wake.set()
+    def pending(self, meme_id: str) -> int:
+        """
+        The not yet written change to a meme's vote count, for reading counts through the buffer.
+        """
+        return self.deltas.get(meme_id, 0) + self.inflight.get(meme_id, 0)
+    async def flush(self) -> int:
+        """
+        Writes all buffered deltas. Deltas that weren't applied are put back for the next
+        flush; when the batch partly succeeded, only the failed writes are.
+        """
+        deltas, self.deltas, self.events = self.deltas, {}, 0
+        pending = [(meme_id, delta) for meme_id, delta in deltas.items() if delta]
+        updates = [
+            pymongo.UpdateOne(
+                {"meme_id": meme_id},
+                [
+                    {"$set": {"votes": {"$add": ["$votes", delta]}}},
+                    {"$set": {"hot": core.meme.HOT_SCORE_EXPR}}
+                ]
+            )
+            for meme_id, delta in pending
+        ]
+        if not updates:
+            return 0
+        for meme_id, delta in pending:
+            self.inflight[meme_id] = self.inflight.get(meme_id, 0) + delta
+        try:
+            await self.db.memes.bulk_write(updates, ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            # The other updates were applied; putting them back would count them twice.
+            for error in e.details.get("writeErrors", []):
+                meme_id, delta = pending[error["index"]]
+                if error.get("code") in TRANSIENT_WRITE_ERRORS:
+                    self.deltas[meme_id] = self.deltas.get(meme_id, 0) + delta
+                else:
+                    logger.error("Dropped vote delta %+d for meme %s: %s", delta, meme_id, error.get("errmsg"))
+            raise
+        except Exception:
+            for meme_id, delta in pending:
+                self.deltas[meme_id] = self.deltas.get(meme_id, 0) + delta
+            raise
+        finally:
+            # Whatever failed is back in deltas by now, so nothing is counted twice or missed.
+            for meme_id, delta in pending:
+                remaining = self.inflight.pop(meme_id) - delta
+                if remaining:
+                    self.inflight[meme_id] = remaining
+        return len(updates)
+    async def run(self, stop: asyncio.Event) -> None:
+        """
+        Flushes every flush_interval_ms, or sooner once flush_max_events votes are buffered,
+        and a final time when stop is set.
+        """
+        stopped = asyncio.create_task(stop.wait())
+        try:
+            while not stop.is_set():
+                woken = asyncio.create_task(self.wake.wait())
+                await asyncio.wait(
+                    [stopped, woken],
+                    timeout=self.config.votes.flush_interval_ms / 1000,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                woken.cancel()
+                self.wake.clear()
+                try:
+                    await self.flush()
+                except Exception:
+                    logger.exception("Vote flush failed")
+        finally:
+            stopped.cancel()
+            await self.flush()
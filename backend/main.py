@@ -11,30 +11,134 @@ import core.database
 import core.profile
 import core.image_utils
 import core.meme
+import core.jobs
+import core.transcode
+import core.serving
+import core.middleware
+import core.passwords
+import core.leaderboard
+import core.dedup
+import core.ratelimit
+import core.schema
+import core.metrics
 import schemas.auth
 import schemas.meme
 import schemas.common
-import time
-import base64
-import io
+import schemas.admin
+import schemas.health
+import asyncio
+import os
+import prometheus_client
+import prometheus_client.multiprocess
+from contextlib import asynccontextmanager
 from typing import Annotated
 from fastapi import FastAPI, Request, Response, Header, File, UploadFile, Form
-from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-
-# Instantiation
-app = FastAPI()
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
 # Setup
 config = core.config.load_config()
-authorization_manager = core.auth.AuthManager(config=config)
-profile_manager = core.profile.ProfileManager(config=config)
-image_processor = core.image_utils.ImageProcessor()
-meme_manager = core.meme.MemeManager(config=config)
-db_client = core.database.factory(
-    config.mongodb.uri,
-    config.mongodb.db
+image_processor = core.image_utils.ImageProcessor(config=config)
+rate_limiter = core.ratelimit.RateLimiter(config=config)
+authorization_manager: core.auth.AuthManager
+profile_manager: core.profile.ProfileManager
+meme_manager: core.meme.MemeManager
+job_queue: core.jobs.JobQueue
+stats_collector: core.metrics.StatsCollector
+background_stop = asyncio.Event()
+background_tasks: list[asyncio.Task] = []
+draining = asyncio.Event()
+
+def begin_drain() -> None:
+    """
+    Called on SIGTERM by run_server.py: readiness starts failing and open event streams
+    end, so the server's graceful shutdown only waits for real requests.
+    """
+    draining.set()
+
+async def close_streams() -> None:
+    await draining.wait()
+    meme_manager.events.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Opens the process-wide MongoDB client, builds the managers on it and runs the upload workers.
+    """
+    global authorization_manager, profile_manager, meme_manager, job_queue, stats_collector
+    client = core.database.create_client(
+        config.mongodb,
+        event_listeners=[core.metrics.CommandTimer()] if config.metrics.enabled else None
+    )
+    db = client[config.mongodb.db]
+    await core.schema.ensure_indexes(db, config)
+    authorization_manager = core.auth.AuthManager(config=config, db=db)
+    profile_manager = core.profile.ProfileManager(config=config, db=db)
+    meme_manager = core.meme.MemeManager(config=config, db=db)
+    job_queue = core.jobs.JobQueue(config=config, db=db)
+    rate_limiter.bind(db)
+    # Signed tokens are never looked up, so load the revocation list before serving.
+    await authorization_manager.poll_revocations()
+    if config.upload.mode == "async" and config.upload.workers > 0:
+        upload_worker = core.jobs.UploadWorker(
+            config=config,
+            job_queue=job_queue,
+            meme_manager=meme_manager,
+            image_processor=image_processor
+        )
+        background_tasks.extend(core.jobs.start_workers(upload_worker, config.upload.workers, background_stop))
+    background_tasks.append(asyncio.create_task(authorization_manager.watch_revocations(background_stop)))
+    background_tasks.append(asyncio.create_task(meme_manager.leaderboard.run(background_stop)))
+    if meme_manager.vote_buffer is not None:
+        # Flushes whatever is still buffered once background_stop is set.
+        background_tasks.append(asyncio.create_task(meme_manager.vote_buffer.run(background_stop)))
+    if meme_manager.events is not None:
+        background_tasks.append(asyncio.create_task(meme_manager.events.run(background_stop)))
+        background_tasks.append(asyncio.create_task(close_streams()))
+    if config.server.warmup:
+        await meme_manager.warm()
+        await image_processor.engine.warm()
+    stats_collector = core.metrics.StatsCollector(
+        caches=lambda: {
+            "image": meme_manager.image_cache_stats(),
+            **authorization_manager.cache_stats()
+        },
+        queues=lambda: {
+            "transcode": image_processor.engine.pending,
+            "password_hash": authorization_manager.password_hasher.pending
+        }
+    )
+    if config.metrics.enabled:
+        prometheus_client.REGISTRY.register(stats_collector)
+    try:
+        yield
+    finally:
+        if config.metrics.enabled:
+            prometheus_client.REGISTRY.unregister(stats_collector)
+            if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+                prometheus_client.multiprocess.mark_process_dead(os.getpid())
+        begin_drain()
+        background_stop.set()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        image_processor.engine.shutdown()
+        authorization_manager.password_hasher.shutdown()
+        client.close()
+
+# Instantiation
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+app.add_middleware(
+    core.middleware.UploadSizeLimitMiddleware,
+    path="/a/meme",
+    max_bytes=config.upload.max_bytes + config.upload.chunk_size
 )
+if config.rate_limit.enabled:
+    app.add_middleware(
+        core.middleware.RateLimitMiddleware,
+        limiter=rate_limiter,
+        identify=lambda token: authorization_manager.cached_username(token),
+        trusted_hops=config.rate_limit.trusted_hops
+    )
 app.add_middleware(
     CORSMiddleware,
     allow_origins=list(config.server.cors_allowed_origins),
@@ -42,19 +146,31 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if config.metrics.enabled:
+    app.add_middleware(
+        core.middleware.MetricsMiddleware,
+        trace_sample_rate=config.metrics.trace_sample_rate
+    )
 
 # Auth routes
 @app.post("/a/auth/login")
-def auth_login(login_request: schemas.auth.LoginRequest):
-    if not authorization_manager.verify_credentials(
-        username=login_request.username,
-        password=login_request.password
-    ):
+async def auth_login(login_request: schemas.auth.LoginRequest):
+    try:
+        valid = await authorization_manager.verify_credentials(
+            username=login_request.username,
+            password=login_request.password
+        )
+    except core.passwords.HasherBusy:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=503
+        )
+    if not valid:
         return schemas.common.ResponseModel(
             success=False,
             code=401
         )
-    auth_token = authorization_manager.create_auth_token(
+    auth_token = await authorization_manager.create_auth_token(
         username=login_request.username
     )
     return schemas.auth.LoginResponse(
@@ -64,21 +180,27 @@ def auth_login(login_request: schemas.auth.LoginRequest):
     )
 
 @app.post("/a/auth/register")
-def auth_register(register_request: schemas.auth.RegisterRequest):
-    success = authorization_manager.create_credentials(
-        username=register_request.username,
-        password=register_request.password
-    )
+async def auth_register(register_request: schemas.auth.RegisterRequest):
+    try:
+        success = await authorization_manager.create_credentials(
+            username=register_request.username,
+            password=register_request.password
+        )
+    except core.passwords.HasherBusy:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=503
+        )
     if not success:
         return schemas.common.ResponseModel(
             success=False,
             code=409
         )
-    profile_manager.create_profile(
+    await profile_manager.create_profile(
         username=register_request.username,
         email=register_request.email
     )
-    auth_token = authorization_manager.create_auth_token(
+    auth_token = await authorization_manager.create_auth_token(
         username=register_request.username
     )
     return schemas.auth.RegisterResponse(
@@ -87,15 +209,29 @@ def auth_register(register_request: schemas.auth.RegisterRequest):
         auth_token=auth_token
     )
 
+@app.post("/a/auth/logout")
+async def auth_logout(authorization: Annotated[str | None, Header()] = None):
+    code, username = await authorization_manager.verify_auth_header(authorization)
+    if not username:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=code
+        )
+    await authorization_manager.revoke_token(authorization.split(" ")[1])
+    return schemas.common.ResponseModel(
+        success=True,
+        code=200
+    )
+
 @app.get("/a/auth/profile")
-def auth_profile(authorization: Annotated[str | None, Header()] = None):
-    code, username = authorization_manager.verify_auth_header(authorization)
+async def auth_profile(authorization: Annotated[str | None, Header()] = None):
+    code, username = await authorization_manager.verify_auth_header(authorization)
     if not username:
         return schemas.common.ResponseModel(
             success=False,
             code=code
         )
-    profile = profile_manager.get_profile(username)
+    profile = await profile_manager.get_profile(username)
     if not profile:
         return schemas.common.ResponseModel(
             success=False,
@@ -116,7 +252,7 @@ async def meme_add(
     image: UploadFile = File(...),
     authorization: Annotated[str | None, Header()] = None
 ):
-    code, username = authorization_manager.verify_auth_header(authorization)
+    code, username = await authorization_manager.verify_auth_header(authorization)
     if not username:
         return schemas.common.ResponseModel(
             success=False,
@@ -127,17 +263,29 @@ async def meme_add(
             success=False,
             code=400
         )
-    success, base64_data, _ = await image_processor.process_image(image)
-    if not success or not base64_data:
+    if config.upload.mode == "async":
+        return await meme_add_async(title, image, username)
+    find_duplicate = meme_manager.duplicates.find if meme_manager.duplicates is not None else None
+    try:
+        success, renditions, _, phash = await image_processor.process_image(image, find_duplicate=find_duplicate)
+    except core.transcode.TranscoderBusy:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=503
+        )
+    except core.dedup.DuplicateUpload as duplicate:
+        return await meme_add_duplicate(title, duplicate, username)
+    if not success or not renditions:
         return schemas.common.ResponseModel(
             success=False,
             code=400
         )
     try:
-        meme_id = meme_manager.add_meme(
+        meme_id = await meme_manager.add_meme(
             title=title,
-            base64_data=base64_data,
-            username=username
+            renditions=renditions,
+            username=username,
+            phash=phash
         )
         if not meme_id:
             return schemas.common.ResponseModel(
@@ -155,9 +303,91 @@ async def meme_add(
             code=500
         )
 
+async def meme_add_duplicate(title: str, duplicate: core.dedup.DuplicateUpload, username: str):
+    original_id = duplicate.meme.get("duplicate_of", duplicate.meme["meme_id"])
+    if config.dedup.mode == "reject":
+        return schemas.common.ResponseModel(
+            success=False,
+            code=409,
+            data={"duplicate_of": original_id}
+        )
+    meme_id = await meme_manager.add_linked_meme(title, duplicate.meme, username, duplicate.phash)
+    if meme_id is None:
+        # The original was deleted while linking; a retry finds no duplicate and stores the upload.
+        return schemas.common.ResponseModel(
+            success=False,
+            code=503
+        )
+    return schemas.meme.MemeResponse(
+        success=True,
+        code=201,
+        meme_id=meme_id,
+        duplicate_of=original_id
+    )
+
+async def meme_add_async(title: str, image: UploadFile, username: str):
+    success, upload, _ = await image_processor.read_upload(image)
+    if not success or not upload:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=400
+        )
+    try:
+        phash = None
+        if meme_manager.duplicates is not None:
+            # Hashing is cheap next to transcoding, so reposts are caught before anything is stored.
+            phash = await image_processor.engine.fingerprint(upload.source())
+            duplicate = await meme_manager.duplicates.find(phash) if phash is not None else None
+            if duplicate is not None:
+                return await meme_add_duplicate(title, core.dedup.DuplicateUpload(duplicate, phash), username)
+        raw_key = await meme_manager.blob_store.put_source(upload.source())
+        meme_id = await meme_manager.add_pending_meme(
+            title=title,
+            username=username,
+            phash=phash
+        )
+        await job_queue.enqueue(meme_id, raw_key)
+        return schemas.meme.MemeResponse(
+            success=True,
+            code=202,
+            meme_id=meme_id,
+            status="processing"
+        )
+    except core.transcode.TranscoderBusy:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=503
+        )
+    except Exception as e:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=500
+        )
+    finally:
+        upload.close()
+
+@app.get("/a/meme/{meme_id}/status")
+async def meme_status(meme_id: str):
+    status = await meme_manager.get_meme_status(meme_id)
+    if not status:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=404
+        )
+    job = await job_queue.get_job(meme_id)
+    return schemas.meme.MemeStatusResponse(
+        success=True,
+        code=200,
+        meme_id=meme_id,
+        status=status,
+        job_status=job["status"] if job else None,
+        attempts=job["attempts"] if job else None,
+        error=job["error"] if job else None
+    )
+
 @app.delete("/a/meme/{meme_id}/delete")
-def meme_delete(meme_id: str, authorization: Annotated[str | None, Header()] = None):
-    code, username = authorization_manager.verify_auth_header(authorization)
+async def meme_delete(meme_id: str, authorization: Annotated[str | None, Header()] = None):
+    code, username = await authorization_manager.verify_auth_header(authorization)
     if not username:
         return schemas.common.ResponseModel(
             success=False,
@@ -168,66 +398,133 @@ def meme_delete(meme_id: str, authorization: Annotated[str | None, Header()] = N
             success=False,
             code=403
         )
-    res = meme_manager.delete_meme(meme_id)
+    res = await meme_manager.delete_meme(meme_id)
     return schemas.common.ResponseModel(
         success=True,
         code=200 if res else 404
     )
 
 @app.get("/a/meme/{meme_id}")
-def meme_get(meme_id: str):
-    meme = meme_manager.get_meme(meme_id)
-    if not meme:
+async def meme_get(
+    meme_id: str,
+    size: str = "full",
+    accept: Annotated[str | None, Header()] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+    range: Annotated[str | None, Header()] = None,
+    if_range: Annotated[str | None, Header()] = None
+):
+    image = await meme_manager.load_image(
+        meme_id,
+        size=size,
+        accept_webp=bool(accept and "image/webp" in accept)
+    )
+    if not image:
         return schemas.common.ResponseModel(
             success=False,
             code=404
         )
+    key, image_format, view = image
+    return core.serving.blob_response(
+        view,
+        key,
+        media_type=f"image/{image_format}",
+        if_none_match=if_none_match,
+        range_header=range,
+        if_range=if_range,
+        headers={
+            "Content-Disposition": f"inline; filename=meme_{meme_id}.{'jpg' if image_format == 'jpeg' else image_format}",
+            "Cache-Control": "public, max-age=3600",
+            "Vary": "Accept"
+        }
+    )
+
+@app.get("/a/meme")
+async def meme_list(
+    sort: str = "new",
+    cursor: str | None = None,
+    limit: int = 8,
+    authorization: Annotated[str | None, Header()] = None
+):
+    code, username = await authorization_manager.verify_auth_header(authorization)
     try:
-        image_data = base64.b64decode(meme["image_data"])
-        return StreamingResponse(
-            io.BytesIO(image_data),
-            media_type="image/jpeg",
-            headers={
-                "Content-Disposition": f"inline; filename=meme_{meme_id}.jpg",
-                "Cache-Control": "public, max-age=3600"
-            }
+        memes, next_cursor = await meme_manager.list_memes(
+            sort=sort,
+            cursor=cursor,
+            limit=limit,
+            username=username
         )
-    except Exception as e:
+    except ValueError:
         return schemas.common.ResponseModel(
             success=False,
-            code=500
+            code=400
         )
+    # Feed pages skip the model round trip; the envelope is built and encoded directly.
+    return ORJSONResponse(schemas.common.envelope(
+        True,
+        200,
+        memes=memes,
+        next_cursor=next_cursor
+    ))
 
-@app.get("/a/meme")
-def meme_list(authorization: Annotated[str | None, Header()] = None):
-    code, username = authorization_manager.verify_auth_header(authorization)
+@app.post("/a/meme/batch")
+async def meme_batch_get(
+    batch_request: schemas.meme.MemeBatchRequest,
+    authorization: Annotated[str | None, Header()] = None
+):
+    code, username = await authorization_manager.verify_auth_header(authorization)
+    try:
+        memes = await meme_manager.get_memes(batch_request.meme_ids, username=username)
+    except ValueError:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=400
+        )
+    return ORJSONResponse(schemas.common.envelope(
+        True,
+        200,
+        memes=memes
+    ))
+
+@app.put("/a/meme/votes")
+async def meme_batch_vote(
+    vote_request: schemas.meme.MemeBatchVoteRequest,
+    authorization: Annotated[str | None, Header()] = None
+):
+    code, username = await authorization_manager.verify_auth_header(authorization)
     if not username:
-        memes = meme_manager.list_memes(limit=8)
-        return schemas.meme.MemeListResponse(
-            success=True,
-            code=200,
-            memes=memes
+        return schemas.common.ResponseModel(
+            success=False,
+            code=code
         )
-    memes = meme_manager.list_memes(limit=8, username=username)
-    return schemas.meme.MemeListResponse(
+    try:
+        applied = await meme_manager.vote_memes(
+            [(vote.meme_id, vote.upvote, vote.clicked) for vote in vote_request.votes],
+            username
+        )
+    except ValueError:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=400
+        )
+    return schemas.meme.MemeBatchVoteResponse(
         success=True,
         code=200,
-        memes=memes
+        applied=applied
     )
 
 @app.put("/a/meme/{meme_id}/vote")
-def meme_vote(
+async def meme_vote(
     meme_id: str,
     vote_request: schemas.meme.MemeVoteRequest,
     authorization: Annotated[str | None, Header()] = None
 ):
-    code, username = authorization_manager.verify_auth_header(authorization)
+    code, username = await authorization_manager.verify_auth_header(authorization)
     if not username:
         return schemas.common.ResponseModel(
             success=False,
             code=code
         )
-    res = meme_manager.vote_meme(
+    res = await meme_manager.vote_meme(
         meme_id,
         vote_request.upvote,
         vote_request.clicked,
@@ -237,3 +534,178 @@ def meme_vote(
         success=True,
         code=200 if res else 404
     )
+
+@app.get("/a/leaderboard")
+async def leaderboard_get(
+    window: str = "all",
+    if_none_match: Annotated[str | None, Header()] = None,
+    authorization: Annotated[str | None, Header()] = None
+):
+    if window not in core.leaderboard.WINDOWS:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=400
+        )
+    code, username = await authorization_manager.verify_auth_header(authorization)
+    memes = [dict(meme) for meme in meme_manager.leaderboard.top(window)]
+    voted_memes = await meme_manager.user_votes(username, [meme["meme_id"] for meme in memes]) if username else {}
+    for meme in memes:
+        meme["user_vote"] = voted_memes.get(meme["meme_id"], None)
+    version = core.leaderboard.make_version(memes)
+    headers = {
+        "ETag": core.serving.make_etag(version),
+        "Cache-Control": "no-cache",
+        "Vary": "Authorization"
+    }
+    if core.serving.etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(schemas.common.envelope(
+        True,
+        200,
+        memes=memes,
+        window=window,
+        version=version
+    ), headers=headers)
+
+# Stream routes
+@app.get("/a/stream")
+async def stream():
+    if meme_manager.events is None:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=404
+        )
+    # Public events only, so no token lookup per connection.
+    return StreamingResponse(
+        meme_manager.events.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Admin routes
+@app.get("/a/admin/cache")
+async def admin_cache_stats(authorization: Annotated[str | None, Header()] = None):
+    code, username = await authorization_manager.verify_auth_header(authorization)
+    if not username:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=code
+        )
+    if username != config.auth.admin_username:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=403
+        )
+    return schemas.admin.CacheStatsResponse(
+        success=True,
+        code=200,
+        image_cache=meme_manager.image_cache_stats(),
+        token_cache=authorization_manager.cache_stats()
+    )
+
+@app.post("/a/admin/memes/delete")
+async def admin_bulk_delete(
+    delete_request: schemas.admin.BulkDeleteRequest,
+    authorization: Annotated[str | None, Header()] = None
+):
+    code, username = await authorization_manager.verify_auth_header(authorization)
+    if not username:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=code
+        )
+    if username != config.auth.admin_username:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=403
+        )
+    try:
+        deleted = await meme_manager.delete_memes(delete_request.meme_ids)
+    except ValueError:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=400
+        )
+    return schemas.admin.BulkDeleteResponse(
+        success=True,
+        code=200,
+        deleted=deleted
+    )
+
+@app.delete("/a/admin/sessions/{target_username}")
+async def admin_revoke_sessions(target_username: str, authorization: Annotated[str | None, Header()] = None):
+    code, username = await authorization_manager.verify_auth_header(authorization)
+    if not username:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=code
+        )
+    if username != config.auth.admin_username:
+        return schemas.common.ResponseModel(
+            success=False,
+            code=403
+        )
+    await authorization_manager.revoke_user_tokens(target_username)
+    return schemas.common.ResponseModel(
+        success=True,
+        code=200
+    )
+
+# Health routes
+@app.get("/a/health/live", include_in_schema=False)
+async def health_live(response: Response):
+    # A background loop that died on its own won't come back without a restart.
+    alive = draining.is_set() or not any(task.done() for task in background_tasks)
+    if not alive:
+        response.status_code = 503
+    return schemas.health.HealthResponse(
+        success=alive,
+        code=200 if alive else 503,
+        checks={"background_tasks": alive}
+    )
+
+@app.get("/a/health/ready", include_in_schema=False)
+async def health_ready(response: Response):
+    try:
+        await asyncio.wait_for(meme_manager.db.command("ping"), config.server.health_timeout)
+        database = True
+    except Exception:
+        database = False
+    queues = {
+        "transcode": image_processor.engine.pending,
+        "password_hash": authorization_manager.password_hasher.pending
+    }
+    if config.upload.mode == "async" and database:
+        queues["upload_jobs"] = await job_queue.depth()
+    checks = {
+        "accepting": not draining.is_set(),
+        "database": database,
+        "transcode": image_processor.engine.check() and queues["transcode"] < image_processor.engine.capacity(),
+        "password_hash": queues["password_hash"] < authorization_manager.password_hasher.capacity
+    }
+    ready = all(checks.values())
+    if not ready:
+        response.status_code = 503
+    return schemas.health.HealthResponse(
+        success=ready,
+        code=200 if ready else 503,
+        checks=checks,
+        queues=queues
+    )
+
+# Metrics routes
+if config.metrics.enabled:
+    @app.get(config.metrics.path, include_in_schema=False)
+    async def metrics():
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            # Several workers: sum every worker's metric files.
+            registry = prometheus_client.CollectorRegistry()
+            prometheus_client.multiprocess.MultiProcessCollector(registry)
+            # Cache and queue gauges are read live, so they are the answering worker's own.
+            registry.register(stats_collector)
+        else:
+            registry = prometheus_client.REGISTRY
+        return Response(
+            content=prometheus_client.generate_latest(registry),
+            media_type=prometheus_client.CONTENT_TYPE_LATEST
+        )
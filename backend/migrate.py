@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Data migrations for MemeArena.
+Usage: python migrate.py blobs [--batch-size N]
+       python migrate.py hot
+       python migrate.py votes [--batch-size N]
+       python migrate.py phash [--batch-size N]
+       python migrate.py --check-indexes
+"""
+
+import core.config
+import core.database
+import core.dedup
+import core.meme
+import core.schema
+import argparse
+import asyncio
+import base64
+import pymongo
+import sys
+
+async def migrate_blobs(config: core.config.Config, db, batch_size: int) -> int:
+    """
+    Moves inline base64 image_data fields on memes into the blob store.
+    """
+    meme_manager = core.meme.MemeManager(config=config, db=db)
+    migrated = 0
+    while True:
+        batch = await db.memes.find(
+            {"image_data": {"$exists": True}},
+            {"_id": 1, "image_data": 1}
+        ).limit(batch_size).to_list(None)
+        if not batch:
+            break
+        updates = []
+        for meme in batch:
+            image = await meme_manager.store_image(base64.b64decode(meme["image_data"]))
+            updates.append(pymongo.UpdateOne(
+                {"_id": meme["_id"]},
+                {"$set": {"image": image}, "$unset": {"image_data": ""}}
+            ))
+        await db.memes.bulk_write(updates, ordered=False)
+        migrated += len(updates)
+        print(f"Migrated {migrated} memes")
+    return migrated
+
+async def migrate_hot(db) -> int:
+    """
+    Gives memes stored before feed sorting existed the hot score the feed is ordered by.
+    """
+    result = await db.memes.update_many(
+        {"hot": {"$exists": False}},
+        [{"$set": {"hot": core.meme.HOT_SCORE_EXPR}}]
+    )
+    print(f"Scored {result.modified_count} memes")
+    return result.modified_count
+
+async def migrate_votes(db, batch_size: int) -> int:
+    """
+    Moves each profile's voted_memes map into one votes document per (username, meme_id).
+    """
+    migrated = 0
+    while True:
+        batch = await db.profiles.find(
+            {"voted_memes": {"$exists": True}},
+            {"_id": 1, "username": 1, "voted_memes": 1}
+        ).limit(batch_size).to_list(None)
+        if not batch:
+            break
+        votes = [
+            pymongo.UpdateOne(
+                {"username": profile["username"], "meme_id": meme_id},
+                {"$setOnInsert": {"upvote": upvote, "voted_at": 0}},
+                upsert=True
+            )
+            for profile in batch
+            for meme_id, upvote in profile["voted_memes"].items()
+        ]
+        if votes:
+            await db.votes.bulk_write(votes, ordered=False)
+        await db.profiles.bulk_write([
+            pymongo.UpdateOne({"_id": profile["_id"]}, {"$unset": {"voted_memes": ""}})
+            for profile in batch
+        ], ordered=False)
+        migrated += len(votes)
+        print(f"Migrated {migrated} votes")
+    return migrated
+
+async def migrate_phash(config: core.config.Config, db, batch_size: int) -> int:
+    """
+    Hashes the images of memes stored before duplicate detection, so new uploads match them.
+    """
+    meme_manager = core.meme.MemeManager(config=config, db=db)
+    hashed = 0
+    last_id = None
+    while True:
+        query = {"phash": {"$exists": False}, "image.key": {"$exists": True}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await db.memes.find(query, {"_id": 1, "image.key": 1}).sort("_id", 1).limit(batch_size).to_list(None)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        updates = []
+        for meme in batch:
+            data = await meme_manager.blob_store.get(meme["image"]["key"])
+            if data is None:
+                continue
+            updates.append(pymongo.UpdateOne(
+                {"_id": meme["_id"]},
+                {"$set": core.dedup.hash_fields(core.dedup.dhash(data, config.transcode.width, config.transcode.height))}
+            ))
+        if updates:
+            await db.memes.bulk_write(updates, ordered=False)
+        hashed += len(updates)
+        print(f"Hashed {hashed} memes")
+    return hashed
+
+async def check_indexes(config: core.config.Config, db) -> bool:
+    """
+    Builds the indexes, then explains every manager query. Returns False if any is a collection scan.
+    """
+    await core.schema.ensure_indexes(db, config)
+    scans = await core.schema.check_indexes(db)
+    for label in scans:
+        print(f"COLLSCAN: {label}")
+    if not scans:
+        print("All manager queries use an index")
+    return not scans
+
+async def main(args: argparse.Namespace) -> int:
+    config = core.config.load_config()
+    client = core.database.create_client(config.mongodb)
+    db = client[config.mongodb.db]
+    try:
+        if args.check_indexes and not await check_indexes(config, db):
+            return 1
+        if args.migration == "blobs":
+            await migrate_blobs(config, db, args.batch_size)
+        elif args.migration == "hot":
+            await migrate_hot(db)
+        elif args.migration == "votes":
+            await core.schema.ensure_indexes(db, config)
+            await migrate_votes(db, args.batch_size)
+        elif args.migration == "phash":
+            await core.schema.ensure_indexes(db, config)
+            await migrate_phash(config, db, args.batch_size)
+        return 0
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MemeArena data migrations")
+    parser.add_argument("--check-indexes", action="store_true", help="fail if any manager query is a collection scan")
+    subparsers = parser.add_subparsers(dest="migration")
+    blobs_parser = subparsers.add_parser("blobs", help="move image_data into the blob store")
+    blobs_parser.add_argument("--batch-size", type=int, default=100)
+    subparsers.add_parser("hot", help="compute hot scores for memes that lack one")
+    votes_parser = subparsers.add_parser("votes", help="move profiles.voted_memes into the votes collection")
+    votes_parser.add_argument("--batch-size", type=int, default=100)
+    phash_parser = subparsers.add_parser("phash", help="compute duplicate-detection hashes for memes that lack one")
+    phash_parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    if not args.migration and not args.check_indexes:
+        parser.error("a migration or --check-indexes is required")
+    sys.exit(asyncio.run(main(args)))
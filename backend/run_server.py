@@ -1,16 +1,81 @@
 #!/usr/bin/env python3
 """
-Simple server runner for development.
-Run this script to start the FastAPI server with the meme upload functionality.
+Server runner for MemeArena.
+Starts [server] workers processes (one per CPU when 0) sharing one listening socket.
+Workers are spawned, not forked, and each builds its own MongoDB client, pools and caches
+in the app lifespan, warming them before it accepts connections. On SIGTERM a worker
+fails readiness, ends its event streams and finishes in-flight requests, then the lifespan
+lets upload workers finish their jobs and flushes buffered votes.
+Pass --reload for a single auto-reloading development server.
 """
 
+import core.config
+import argparse
+import logging
+import os
+import shutil
+import tempfile
 import uvicorn
+from uvicorn.supervisors import Multiprocess
 
-if __name__ == "__main__":
-    uvicorn.run(
+logger = logging.getLogger("run_server")
+
+class Server(uvicorn.Server):
+    def handle_exit(self, sig, frame) -> None:
+        import main  # Already loaded by this worker.
+        main.begin_drain()
+        super().handle_exit(sig, frame)
+
+class Supervisor(Multiprocess):
+    def shutdown(self) -> None:
+        # Signal every worker before waiting, so they drain in parallel.
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+
+def check_shared_state(config: core.config.Config) -> None:
+    if config.cache.enabled and (not config.stream.enabled or config.stream.broker == "memory"):
+        logger.warning("cache is enabled without a shared stream broker: deleted memes stay in other workers' image caches")
+    if config.stream.enabled and config.stream.broker == "memory":
+        logger.warning("stream.broker is \"memory\": clients only see events from the worker they are connected to")
+    if config.rate_limit.enabled and config.rate_limit.backend == "memory":
+        logger.warning("rate_limit.backend is \"memory\": every worker allows its own burst")
+
+def main(workers: int | None, reload: bool) -> None:
+    config = core.config.load_config()
+    if reload:
+        uvicorn.run("main:app", host=config.server.host, port=config.server.port, reload=True, log_level="info")
+        return
+    workers = workers or config.server.workers or os.cpu_count() or 1
+    metrics_dir = None
+    if workers > 1:
+        check_shared_state(config)
+        if config.metrics.enabled and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+            metrics_dir = tempfile.mkdtemp(prefix="memearena-metrics-")
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+    server_config = uvicorn.Config(
         "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
+        host=config.server.host,
+        port=config.server.port,
+        workers=workers,
+        timeout_graceful_shutdown=config.server.graceful_timeout,
         log_level="info"
     )
+    server = Server(server_config)
+    try:
+        if workers == 1:
+            server.run()
+        else:
+            Supervisor(server_config, target=server.run, sockets=[server_config.bind_socket()]).run()
+    finally:
+        if metrics_dir is not None:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MemeArena API server")
+    parser.add_argument("--workers", type=int, default=None, help="overrides [server] workers")
+    parser.add_argument("--reload", action="store_true", help="single auto-reloading process for development")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    main(args.workers, args.reload)
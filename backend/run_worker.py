@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Standalone upload worker.
+Drains the upload job queue outside the API process. Set [upload] workers = 0
+in config.toml to leave all queued uploads to this process.
+"""
+
+import core.config
+import core.database
+import core.image_utils
+import core.jobs
+import core.meme
+import argparse
+import asyncio
+import logging
+import signal
+
+async def main(concurrency: int) -> None:
+    config = core.config.load_config()
+    client = core.database.create_client(config.mongodb)
+    db = client[config.mongodb.db]
+    image_processor = core.image_utils.ImageProcessor(config=config)
+    meme_manager = core.meme.MemeManager(config=config, db=db)
+    worker = core.jobs.UploadWorker(
+        config=config,
+        job_queue=core.jobs.JobQueue(config=config, db=db),
+        meme_manager=meme_manager,
+        image_processor=image_processor
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        tasks = core.jobs.start_workers(worker, concurrency, stop)
+        if meme_manager.events is not None:
+            # Completed uploads reach the API workers' streams through the broker.
+            tasks.append(asyncio.create_task(meme_manager.events.run(stop)))
+        await asyncio.gather(*tasks)
+    finally:
+        image_processor.engine.shutdown()
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MemeArena upload worker")
+    parser.add_argument("--concurrency", type=int, default=2)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.concurrency))
@@ -0,0 +1,12 @@
+import schemas.common
+from pydantic import BaseModel
+
+class CacheStatsResponse(schemas.common.ResponseModel):
+    image_cache: dict[str, int] | None = None
+    token_cache: dict[str, dict[str, int]] | None = None
+
+class BulkDeleteRequest(BaseModel):
+    meme_ids: list[str]
+
+class BulkDeleteResponse(schemas.common.ResponseModel):
+    deleted: list[str]
@@ -0,0 +1,5 @@
+import schemas.common
+
+class HealthResponse(schemas.common.ResponseModel):
+    checks: dict[str, bool]
+    queues: dict[str, int] | None = None
@@ -9,8 +9,30 @@ class MemeVoteRequest(BaseModel):
     upvote: bool
     clicked: bool
 
+class MemeBatchRequest(BaseModel):
+    meme_ids: list[str]
+
+class MemeBatchVote(MemeVoteRequest):
+    meme_id: str
+
+class MemeBatchVoteRequest(BaseModel):
+    votes: list[MemeBatchVote]
+
+class MemeBatchVoteResponse(schemas.common.ResponseModel):
+    applied: list[bool]
+
 class MemeListResponse(schemas.common.ResponseModel):
     memes: list[dict]
+    next_cursor: str | None = None
 
 class MemeResponse(schemas.common.ResponseModel):
     meme_id: str
+    status: str | None = None
+    duplicate_of: str | None = None
+
+class MemeStatusResponse(schemas.common.ResponseModel):
+    meme_id: str
+    status: str
+    job_status: str | None = None
+    attempts: int | None = None
+    error: str | None = None
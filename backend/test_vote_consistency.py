@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for meme voting.
+Fires overlapping vote requests (double clicks, switches, withdrawals from several
+"tabs") at MemeManager.vote_meme and checks every meme's vote count still equals
+the sum of its vote records.
+With --mongomock every collection call first yields to the event loop for a random
+moment, as a round trip to mongod would, so requests interleave between their reads
+and writes. mongomock itself runs each call to completion, so each single operation
+stays atomic, as it is on mongod.
+
+Usage: python test_vote_consistency.py [--uri mongodb://localhost:27017] [--mongomock]
+       [--mode direct|buffered] [--users N] [--memes N] [--requests N]
+"""
+
+import core.config
+import core.database
+import core.meme
+import argparse
+import asyncio
+import inspect
+import random
+import sys
+import tempfile
+import time
+
+def make_config(args: argparse.Namespace, blob_path: str) -> core.config.Config:
+    return core.config.Config({
+        "mongodb": {"uri": args.uri, "db": args.db},
+        "auth": {"session_ttl": 3600, "admin_username": "admin"},
+        "storage": {"path": blob_path},
+        "votes": {"mode": args.mode, "transactions": args.transactions}
+    })
+
+class YieldingCollection:
+    def __init__(self, collection) -> None:
+        self.collection = collection
+    def __getattr__(self, name: str):
+        attribute = getattr(self.collection, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+        async def call(*args, **kwargs):
+            await asyncio.sleep(random.random() / 1000)
+            return await attribute(*args, **kwargs)
+        return call
+
+class YieldingDatabase:
+    def __init__(self, db) -> None:
+        self.db = db
+    def __getattr__(self, name: str):
+        return YieldingCollection(getattr(self.db, name))
+    def __getitem__(self, name: str):
+        return YieldingCollection(self.db[name])
+
+def make_client(args: argparse.Namespace, config: core.config.Config):
+    if args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient()
+    return core.database.create_client(config.mongodb)
+
+async def random_vote(meme_manager: core.meme.MemeManager, meme_ids: list[str], usernames: list[str]) -> bool:
+    upvote = random.random() < 0.6
+    return await meme_manager.vote_meme(
+        random.choice(meme_ids),
+        upvote,
+        random.random() < 0.7,
+        random.choice(usernames)
+    )
+
+async def check_counts(db, meme_ids: list[str]) -> list[str]:
+    """
+    Returns a line for every meme whose stored count disagrees with its vote records.
+    """
+    mismatches = []
+    for meme_id in meme_ids:
+        meme = await db.memes.find_one({"meme_id": meme_id}, {"_id": 0, "votes": 1})
+        votes = await db.votes.find({"meme_id": meme_id}, {"_id": 0, "upvote": 1}).to_list(None)
+        expected = sum(1 if vote["upvote"] else -1 for vote in votes)
+        if meme["votes"] != expected:
+            mismatches.append(f"{meme_id}: count {meme['votes']}, records say {expected}")
+    return mismatches
+
+async def main(args: argparse.Namespace) -> int:
+    with tempfile.TemporaryDirectory() as blob_path:
+        config = make_config(args, blob_path)
+        client = make_client(args, config)
+        await client.drop_database(args.db)
+        db = client[args.db]
+        await db.votes.create_index([("username", 1), ("meme_id", 1)], unique=True)
+        meme_manager = core.meme.MemeManager(config=config, db=YieldingDatabase(db) if args.mongomock else db)
+        meme_ids = [f"meme{i}" for i in range(args.memes)]
+        now = time.time()
+        await db.memes.insert_many([
+            {"meme_id": meme_id, "title": meme_id, "username": "admin", "votes": 0,
+             "hot": core.meme.hot_score(0, now), "status": "ready", "created_at": now}
+            for meme_id in meme_ids
+        ])
+        usernames = [f"user{i}" for i in range(args.users)]
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            random_vote(meme_manager, meme_ids, usernames)
+            for _ in range(args.requests)
+        ])
+        elapsed = time.perf_counter() - start
+        if meme_manager.vote_buffer is not None:
+            await meme_manager.vote_buffer.flush()
+
+        print(f"{args.requests} vote requests in {elapsed:.2f}s, {sum(results)} applied")
+        mismatches = await check_counts(db, meme_ids)
+        await client.drop_database(args.db)
+        client.close()
+        for line in mismatches:
+            print(f"MISMATCH {line}")
+        if mismatches:
+            return 1
+        print("All vote counts match their vote records")
+        return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vote consistency stress test")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="memearena_vote_stress")
+    parser.add_argument("--mongomock", action="store_true", help="use mongomock-motor instead of a mongod")
+    parser.add_argument("--mode", choices=["direct", "buffered"], default="direct")
+    parser.add_argument("--transactions", action="store_true", help="needs a replica set")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--memes", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=2000)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -1,7 +1,7 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { memeService } from '../services'
-import { Meme } from '../types/api'
+import { Meme, LeaderboardWindow } from '../types/api'
 import MemeDialog from './MemeDialog'
 import API_CONFIG from '../config/api'
 import './Leaderboard.css'
@@ -15,23 +15,36 @@ function Leaderboard({ selectedMemeId }: LeaderboardProps) {
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState('')
   const [selectedMeme, setSelectedMeme] = useState<Meme | null>(null)
+  const [timeWindow, setTimeWindow] = useState<LeaderboardWindow>('all')
+  // The off-board meme already fetched individually, so live updates don't refetch it every tick
+  const fetchedMemeId = useRef<string | null>(null)
   const navigate = useNavigate()
 
   useEffect(() => {
     loadMemes()
-  }, [])
+  }, [timeWindow])
+
+  // Apply live updates instead of polling; new memes or removals change the ranking, so refetch then
+  useEffect(() => {
+    return memeService.subscribe(batch => {
+      if (batch.new.length > 0 || batch.deleted.length > 0) {
+        loadMemes()
+        return
+      }
+      setMemes(prev => prev
+        .map(meme => meme.meme_id in batch.votes
+          ? { ...meme, votes: meme.votes + batch.votes[meme.meme_id] }
+          : meme)
+        .sort((a, b) => b.votes - a.votes))
+    }, loadMemes)
+  }, [timeWindow])
 
   const loadMemes = async () => {
     try {
-      const response = await memeService.getMemes()
+      // The backend ranks the leaderboard, so the memes arrive in order
+      const response = await memeService.getLeaderboard(timeWindow)
       if (response.success && response.data) {
-        // Backend returns data.memes
-        const memesArray = response.data.memes
-        // Take top 10 memes and sort by votes
-        const topMemes = memesArray
-          .sort((a: Meme, b: Meme) => b.votes - a.votes)
-          .slice(0, 10)
-        setMemes(topMemes)
+        setMemes(response.data.memes)
       } else {
         setError('Failed to load memes')
       }
@@ -50,29 +63,31 @@ function Leaderboard({ selectedMemeId }: LeaderboardProps) {
         const meme = memes.find(m => m.meme_id === selectedMemeId)
         if (meme) {
           setSelectedMeme(meme)
-        } else {
+        } else if (fetchedMemeId.current !== selectedMemeId) {
           // If meme not found in leaderboard, fetch it individually
           loadSingleMeme(selectedMemeId)
         }
-      } else if (!loading) {
+      } else if (!loading && fetchedMemeId.current !== selectedMemeId) {
         // If memes are loaded but empty, try to fetch the individual meme
         loadSingleMeme(selectedMemeId)
       }
       // If still loading, wait for memes to load and this effect will run again
     } else {
       // No selectedMemeId, close dialog
+      fetchedMemeId.current = null
       setSelectedMeme(null)
     }
   }, [selectedMemeId, memes, loading])
 
   const loadSingleMeme = async (memeId: string) => {
+    fetchedMemeId.current = memeId
     console.log('Loading single meme:', memeId)
     try {
-      const response = await memeService.getMeme(memeId)
+      const response = await memeService.getMemesBatch([memeId])
       console.log('Single meme response:', response)
-      if (response.success && response.data) {
-        setSelectedMeme(response.data)
-        console.log('Set selected meme:', response.data)
+      if (response.success && response.data && response.data.memes.length > 0) {
+        setSelectedMeme(response.data.memes[0])
+        console.log('Set selected meme:', response.data.memes[0])
       } else {
         console.error('Failed to load single meme, trying to refresh memes list:', response)
         // If single meme fetch fails, try refreshing the entire list
@@ -136,6 +151,17 @@ function Leaderboard({ selectedMemeId }: LeaderboardProps) {
   return (
     <>
       <div className="leaderboard">
+        <div className="leaderboard-windows">
+          {(['day', 'week', 'all'] as LeaderboardWindow[]).map(option => (
+            <button
+              key={option}
+              className={`leaderboard-window-btn${option === timeWindow ? ' active' : ''}`}
+              onClick={() => setTimeWindow(option)}
+            >
+              {option === 'all' ? 'All time' : `This ${option}`}
+            </button>
+          ))}
+        </div>
         <div className="leaderboard-grid">
           {memes.map((meme, index) => (
             <div 
@@ -146,7 +172,7 @@ function Leaderboard({ selectedMemeId }: LeaderboardProps) {
               <div className="meme-rank">#{index + 1}</div>
               <div className="meme-image-container">
                 <img 
-                  src={`${API_CONFIG.BASE_URL}/a/meme/${meme.meme_id}`}
+                  src={`${API_CONFIG.BASE_URL}${API_CONFIG.ENDPOINTS.MEME_IMAGE(meme.meme_id, 'feed')}`}
                   alt={meme.title}
                   className="meme-image"
                   onError={(e) => {
@@ -66,6 +66,10 @@ function MemeUpload() {
         if (response.data) {
           navigate(`/meme/${response.data.meme_id}`)
         }
+      } else if (response.code === 409 && response.data?.duplicate_of) {
+        // The backend rejects reposts; show the meme that is already up
+        setError('This meme has already been posted.')
+        navigate(`/meme/${response.data.duplicate_of}`)
       } else {
         setError('Failed to upload meme. Please try again.')
       }
@@ -6,12 +6,23 @@ const API_CONFIG = {
     LOGIN: '/a/auth/login',
     REGISTER: '/a/auth/register',
     PROFILE: '/a/auth/profile',
+    LOGOUT: '/a/auth/logout',
     
     // Meme endpoints
     MEMES: '/a/meme',
     MEME_BY_ID: (id: string) => `/a/meme/${id}`,
+    MEME_IMAGE: (id: string, size: 'thumb' | 'feed' | 'full' = 'full') => `/a/meme/${id}?size=${size}`,
     MEME_VOTE: (id: string) => `/a/meme/${id}/vote`,
     MEME_DELETE: (id: string) => `/a/meme/${id}/delete`,
+    MEMES_BATCH: '/a/meme/batch',
+    MEME_VOTES: '/a/meme/votes',
+    ADMIN_BULK_DELETE: '/a/admin/memes/delete',
+
+    // Leaderboard endpoints
+    LEADERBOARD: (window: 'day' | 'week' | 'all' = 'all') => `/a/leaderboard?window=${window}`,
+
+    // Live updates (server-sent events)
+    STREAM: '/a/stream',
   }
 }
 
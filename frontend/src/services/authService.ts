@@ -40,6 +40,8 @@ export class AuthService {
 
   // Logout user
   logout(): void {
+    // Revoke the session server-side; the request captures the token before it is cleared
+    apiClient.post(API_CONFIG.ENDPOINTS.LOGOUT)
     apiClient.clearToken()
   }
 
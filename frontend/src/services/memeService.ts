@@ -1,11 +1,30 @@
 import apiClient from './apiClient'
 import API_CONFIG from '../config/api'
-import { MemeRequest, MemeVoteRequest, ApiResponse, Meme, MemesListData } from '../types/api'
+import { MemeRequest, MemeVoteRequest, ApiResponse, Meme, MemesListData, MemesListParams, LeaderboardData, LeaderboardWindow, StreamBatch, MemeBatchVote, MemeBatchVoteData, BulkDeleteData } from '../types/api'
 
 export class MemeService {
-  // Get all memes
-  async getMemes(): Promise<ApiResponse<MemesListData>> {
-    return apiClient.get<MemesListData>(API_CONFIG.ENDPOINTS.MEMES)
+  // Get a page of memes; pass the previous page's next_cursor as cursor to continue
+  async getMemes(params: MemesListParams = {}): Promise<ApiResponse<MemesListData>> {
+    const query = new URLSearchParams()
+    if (params.sort) query.set('sort', params.sort)
+    if (params.cursor) query.set('cursor', params.cursor)
+    if (params.limit) query.set('limit', String(params.limit))
+    const suffix = query.toString() ? `?${query.toString()}` : ''
+    return apiClient.get<MemesListData>(`${API_CONFIG.ENDPOINTS.MEMES}${suffix}`)
+  }
+
+  // Get the server-ranked leaderboard; the browser revalidates it with its ETag
+  async getLeaderboard(window: LeaderboardWindow = 'all'): Promise<ApiResponse<LeaderboardData>> {
+    return apiClient.get<LeaderboardData>(API_CONFIG.ENDPOINTS.LEADERBOARD(window))
+  }
+
+  // Listen for live vote, new meme and deletion batches; onResync means updates were
+  // dropped and the caller should refetch. Returns a function that closes the stream.
+  subscribe(onBatch: (batch: StreamBatch) => void, onResync: () => void): () => void {
+    const source = new EventSource(`${API_CONFIG.BASE_URL}${API_CONFIG.ENDPOINTS.STREAM}`)
+    source.addEventListener('batch', event => onBatch(JSON.parse((event as MessageEvent).data)))
+    source.addEventListener('resync', onResync)
+    return () => source.close()
   }
 
   // Get meme by ID
@@ -13,6 +32,11 @@ export class MemeService {
     return apiClient.get<Meme>(API_CONFIG.ENDPOINTS.MEME_BY_ID(id))
   }
 
+  // Get metadata for several memes in one request; missing ids are left out
+  async getMemesBatch(ids: string[]): Promise<ApiResponse<MemesListData>> {
+    return apiClient.post<MemesListData>(API_CONFIG.ENDPOINTS.MEMES_BATCH, { meme_ids: ids })
+  }
+
   // Upload meme with binary file
   async uploadMemeFile(title: string, file: File): Promise<ApiResponse<Meme>> {
     const formData = new FormData()
@@ -56,10 +80,20 @@ export class MemeService {
     return apiClient.put<Meme>(API_CONFIG.ENDPOINTS.MEME_VOTE(id), { upvote, clicked })
   }
 
+  // Cast or withdraw several votes in one request (each meme at most once)
+  async voteMemes(votes: MemeBatchVote[]): Promise<ApiResponse<MemeBatchVoteData>> {
+    return apiClient.put<MemeBatchVoteData>(API_CONFIG.ENDPOINTS.MEME_VOTES, { votes })
+  }
+
   // Delete meme (admin only)
   async deleteMeme(id: string): Promise<ApiResponse<void>> {
     return apiClient.delete<void>(API_CONFIG.ENDPOINTS.MEME_DELETE(id))
   }
+
+  // Delete several memes with their votes and images (admin only)
+  async deleteMemes(ids: string[]): Promise<ApiResponse<BulkDeleteData>> {
+    return apiClient.post<BulkDeleteData>(API_CONFIG.ENDPOINTS.ADMIN_BULK_DELETE, { meme_ids: ids })
+  }
 }
 
 // Export singleton instance
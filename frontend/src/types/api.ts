@@ -20,6 +20,19 @@ export interface MemeVoteRequest {
   clicked: boolean
 }
 
+export interface MemeBatchVote extends MemeVoteRequest {
+  meme_id: string
+}
+
+// applied[i] tells whether votes[i] changed anything
+export interface MemeBatchVoteData {
+  applied: boolean[]
+}
+
+export interface BulkDeleteData {
+  deleted: string[]
+}
+
 export interface ApiResponse<T = any> {
   success: boolean
   code: number
@@ -53,8 +66,33 @@ export interface Meme {
   user_vote: boolean | null  // true = upvote, false = downvote, null = no vote
   image_url?: string
   description?: string
+  duplicate_of?: string  // Set when the upload is a repost of this earlier meme
 }
 
 export interface MemesListData {
   memes: Meme[]
+  next_cursor?: string
+}
+
+export type LeaderboardWindow = 'day' | 'week' | 'all'
+
+export interface LeaderboardData {
+  memes: Meme[]
+  window: LeaderboardWindow
+  version: string
+}
+
+// One tick of live changes from /a/stream; votes maps meme_id to a vote delta
+export interface StreamBatch {
+  votes: Record<string, number>
+  new: Omit<Meme, 'user_vote'>[]
+  deleted: string[]
+}
+
+export type MemeSort = 'new' | 'top' | 'hot'
+
+export interface MemesListParams {
+  sort?: MemeSort
+  cursor?: string
+  limit?: number
 }